@@ -0,0 +1,287 @@
+"""
+Adaptive concurrency limiting
+
+Limit the number of in-flight requests with an AIMD controller: the limit
+grows by about one per round trip while latency and the error rate stay
+healthy, and is cut by a factor on throttling (HTTP 429), timeouts or rising
+latency. A cut applies once per congestion event: failures of requests that
+started before the last cut do not cut again.
+
+Latency is compared per unit of request size (e.g. per MB of audio), so long
+segments are not mistaken for congestion.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+def classify_error(error):
+    """
+    Classify the outcome of a request
+
+    Args:
+        error: Exception raised by the request, or None
+
+    Returns:
+        str: "ok", "throttled", "timeout", "cancelled" or "error"
+    """
+    if error is None:
+        return "ok"
+    name = type(error).__name__
+    if "Cancelled" in name:
+        # Stopped on purpose, e.g. the losing attempt of a hedged request
+        return "cancelled"
+    if getattr(error, "status_code", None) == 429 or "RateLimit" in name:
+        return "throttled"
+    if isinstance(error, TimeoutError) or "Timeout" in name:
+        return "timeout"
+    return "error"
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight requests driven by latency and throttling"""
+
+    def __init__(self, name, initial=4, min_limit=1, max_limit=16, decrease=0.5,
+                 latency_tolerance=2.0, max_error_rate=0.1, window=50):
+        """
+        Args:
+            name: Name used in logs and stats
+            initial: Starting limit
+            min_limit: Lowest limit
+            max_limit: Highest limit
+            decrease: Factor the limit is multiplied by on congestion
+            latency_tolerance: Latency above this multiple of the baseline counts as congestion
+            max_error_rate: The limit only grows while the recent error rate is below this
+            window: Number of recent outcomes used for the error rate
+        """
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.in_flight = 0
+        self.outcomes = deque(maxlen=window)
+        self.decisions = deque(maxlen=100)
+        self.counts = {"ok": 0, "throttled": 0, "timeout": 0, "cancelled": 0, "error": 0}
+        self.latency = None    # Fast moving average of latency per unit size
+        self.baseline = None   # Latency per unit size when not congested
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, name, limit_config, adaptive_config):
+        """
+        Build a limiter from configuration dicts
+
+        Args:
+            name: Name used in logs and stats
+            limit_config: Dict with initial, min and max
+            adaptive_config: Dict with decrease, latency_tolerance, max_error_rate and window
+
+        Returns:
+            AdaptiveLimiter: Configured limiter
+        """
+        return cls(
+            name,
+            initial=limit_config["initial"],
+            min_limit=limit_config["min"],
+            max_limit=limit_config["max"],
+            decrease=adaptive_config["decrease"],
+            latency_tolerance=adaptive_config["latency_tolerance"],
+            max_error_rate=adaptive_config["max_error_rate"],
+            window=adaptive_config["window"]
+        )
+
+    def current_limit(self):
+        """Number of requests currently allowed in flight"""
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self):
+        """
+        Wait for a free slot
+
+        Returns:
+            float: Start time, to pass to release
+        """
+        with self._cond:
+            while self.in_flight >= self.current_limit():
+                self._cond.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, outcome, size=1.0):
+        """
+        Release a slot and adjust the limit
+
+        Args:
+            started: Value returned by acquire
+            outcome: "ok", "throttled", "timeout", "cancelled" or "error"
+            size: Request size latency is normalised by, e.g. MB of audio
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._record(started, outcome, size)
+            self._cond.notify_all()
+
+    def record(self, started, outcome, size=1.0):
+        """
+        Adjust the limit from a request whose slot is tracked elsewhere
+
+        Used when another component, e.g. EndpointRouter, admits requests by
+        current_limit() itself.
+
+        Args:
+            started: time.monotonic() when the request was sent
+            outcome: "ok", "throttled", "timeout", "cancelled" or "error"
+            size: Request size latency is normalised by
+        """
+        with self._cond:
+            self._record(started, outcome, size)
+            self._cond.notify_all()
+
+    def _record(self, started, outcome, size):
+        now = time.monotonic()
+        self.counts[outcome] += 1
+        if outcome == "cancelled":
+            # Says nothing about the service
+            return
+        self.outcomes.append(outcome != "ok")
+
+        if outcome in ("throttled", "timeout"):
+            self._cut(started, now, outcome)
+        elif outcome == "ok":
+            sample = (now - started) / max(size, 1e-9)
+            self.latency = sample if self.latency is None else 0.7 * self.latency + 0.3 * sample
+            self.baseline = self.latency if self.baseline is None else min(self.baseline, self.latency)
+            if self.latency > self.latency_tolerance * self.baseline:
+                self._cut(started, now, f"latency {self.latency / self.baseline:.1f}x baseline")
+            elif sum(self.outcomes) <= self.max_error_rate * len(self.outcomes):
+                # Additive increase: about +1 per round trip at the current limit
+                self._set_limit(self.limit + 1 / self.limit, "healthy")
+                # Let the baseline follow slow drift of the service
+                self.baseline = 0.95 * self.baseline + 0.05 * self.latency
+
+    def _cut(self, started, now, reason):
+        if started < self._last_cut:
+            # Started before the last cut: part of the same congestion event
+            return
+        self._last_cut = now
+        self._set_limit(self.limit * self.decrease, reason)
+        if self.latency is not None and self.baseline is not None:
+            # Give the lower limit a chance before judging latency again
+            self.latency = self.baseline
+
+    def _set_limit(self, limit, reason):
+        old = self.current_limit()
+        self.limit = min(float(self.max_limit), max(float(self.min_limit), limit))
+        new = self.current_limit()
+        if new != old:
+            self.decisions.append({
+                "time": time.time(),
+                "action": "increase" if new > old else "decrease",
+                "limit": new,
+                "reason": reason,
+            })
+            if new < old:
+                print(f"{self.name} concurrency limit {old} -> {new}: {reason}")
+
+    def call(self, fn, size=1.0):
+        """
+        Run fn within the limit
+
+        Args:
+            fn: Function taking no arguments
+            size: Request size latency is normalised by
+
+        Returns:
+            The result of fn
+        """
+        started = self.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            self.release(started, classify_error(e), size)
+            raise
+        self.release(started, "ok", size)
+        return result
+
+    def stats(self):
+        """
+        Get the current limit and counters
+
+        Returns:
+            dict: name, limit, in_flight, counts, latency, baseline and recent decisions
+        """
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": self.current_limit(),
+                "in_flight": self.in_flight,
+                "counts": dict(self.counts),
+                "latency": self.latency,
+                "baseline": self.baseline,
+                "decisions": list(self.decisions),
+            }
+
+
+if __name__ == "__main__":
+    # Test case: a stub provider that queues above 6 concurrent requests and throttles above 10
+    from concurrent.futures import ThreadPoolExecutor
+
+    class RateLimitError(Exception):
+        status_code = 429
+
+    class StubProvider:
+        def __init__(self, capacity, throttle_at, service_time):
+            self.capacity = capacity
+            self.throttle_at = throttle_at
+            self.service_time = service_time
+            self.active = 0
+            self.lock = threading.Lock()
+
+        def request(self):
+            with self.lock:
+                if self.active >= self.throttle_at:
+                    raise RateLimitError("429 Too Many Requests")
+                self.active += 1
+                load = self.active
+            try:
+                # Requests beyond capacity share the provider and slow down
+                time.sleep(self.service_time * max(1.0, load / self.capacity))
+            finally:
+                with self.lock:
+                    self.active -= 1
+            return "ok"
+
+    def run(limiter, requests=400, threads=24):
+        provider = StubProvider(capacity=6, throttle_at=10, service_time=0.02)
+        trace = []
+
+        def one(_):
+            try:
+                if limiter is None:
+                    return provider.request()
+                result = limiter.call(provider.request)
+                trace.append(limiter.current_limit())
+                return result
+            except RateLimitError:
+                return "429"
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(one, range(requests)))
+        return results.count("ok"), results.count("429"), time.monotonic() - started, trace
+
+    ok, throttled, elapsed, _ = run(None)
+    print(f"Fixed 24 in flight: {ok} ok, {throttled} throttled, {elapsed:.2f}s")
+
+    limiter = AdaptiveLimiter("stub", initial=2, min_limit=1, max_limit=24)
+    ok, throttled, elapsed, trace = run(limiter)
+    print(f"Adaptive: {ok} ok, {throttled} throttled, {elapsed:.2f}s")
+    print(f"Limit over time: {trace[::40]}")
+    stats = limiter.stats()
+    print(f"Final limit {stats['limit']}, {len(stats['decisions'])} decisions, "
+          f"{sum(d['action'] == 'decrease' for d in stats['decisions'])} decreases")
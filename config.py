@@ -6,6 +6,24 @@ OPENAI_CONFIG = {
     "api_key": os.getenv("OPENAI_API_KEY")
 }
 
+# Whisper API端点列表，请求按未完成请求数与权重之比分配到健康的端点 | Whisper API endpoint list, requests go to the healthy endpoint with the fewest outstanding requests relative to its weight
+# 可添加多个兼容OpenAI的转录服务（如自建whisper服务） | Add several OpenAI-compatible transcription backends (e.g. self-hosted whisper servers)
+OPENAI_ENDPOINTS = [
+    {
+        "base_url": OPENAI_CONFIG["base_url"],
+        "api_key": OPENAI_CONFIG["api_key"],
+        "weight": 1,           # 请求分配权重 | Relative share of requests
+        "max_concurrency": 4   # 最大并发请求数 | Maximum number of in-flight requests
+    },
+]
+
+# 端点路由配置 | Endpoint Routing Configuration
+ROUTER_CONFIG = {
+    "max_errors": 3,   # 连续出错多少次后暂时移除端点 | Consecutive errors after which an endpoint is ejected
+    "cooldown": 60,    # 端点被移除的冷却时间，单位为秒 | Seconds an ejected endpoint stays out of rotation
+    "retries": 2       # 所有端点都失败后重新尝试的轮数，每轮前等待1、2、4…秒 | Rounds over all endpoints after every endpoint failed, backing off 1, 2, 4... seconds
+}
+
 
 # 音频处理配置 | Audio Processing Configuration
 # 大小为25MB、比特率为55kbps的mp3文件大约可以保存1小时的音频 | A 25MB MP3 file at 55kbps can store about 1 hour of audio
@@ -56,4 +74,104 @@ AI_CONFIG = {
     "api_key": os.getenv("AI_API_KEY"),
     "model": "claude-3-5-sonnet-20241022",  # 使用的模型名称 | Model name to use
     "system_prompt": prompt  # 如果需要英文版本，可以改为 prompt_en | Change to prompt_en for English version
-}
\ No newline at end of file
+}
+
+# 对冲请求配置 | Hedged Request Configuration
+# 转录请求耗时超过近期请求的延迟百分位时，发送一个重复请求，取先返回的结果 | When a transcription request runs past a latency percentile of recent requests, fire a duplicate and keep whichever answers first
+HEDGE_CONFIG = {
+    "enabled": False,         # 是否启用对冲请求 | Whether to enable hedged requests
+    "percentile": 0.95,       # 触发对冲的延迟百分位 | Latency percentile that triggers a hedge
+    "window": 200,            # 用于估计百分位的近期请求数 | Number of recent requests used to estimate the percentile
+    "min_samples": 20,        # 开始对冲前至少观察的请求数 | Requests to observe before hedging starts
+    "min_delay": 5.0,         # 对冲延迟下限，单位为秒 | Lower bound of the hedge delay in seconds
+    "max_extra_ratio": 0.1    # 重复请求数占请求总数的上限 | Maximum ratio of duplicate requests to primary requests
+}
+
+
+# 批量调度配置 | Batch Scheduling Configuration
+# 根据音频时长安排处理顺序，需要分割的大文件按分段作为独立的调度单元 | Order work by probed duration, large files that need splitting are scheduled segment by segment
+SCHEDULE_CONFIG = {
+    "policy": "lpt",            # 调度策略：lpt（最长优先，最短总耗时）或 spt（最短优先，最短平均等待） | Policy: lpt (longest first, shortest makespan) or spt (shortest first, lowest mean latency)
+    "workers": 4,               # 默认的并行上传数，实际由 PIPELINE_CONFIG["transcribe_workers"] 决定 | Default upload concurrency, runs use PIPELINE_CONFIG["transcribe_workers"]
+    "realtime_factor": 0.1,     # 每秒音频的预计处理时间，单位为秒 | Estimated processing seconds per second of audio
+    "request_overhead": 5.0     # 每个单元的固定开销，单位为秒 | Fixed overhead per unit in seconds
+}
+
+
+# 流水线配置 | Pipeline Configuration
+# 截取/转换、上传转录、AI处理三个步骤通过有界队列连接，各自使用独立的并行数 | Convert/cut, upload and post-processing stages are connected by bounded queues, each with its own worker count
+PIPELINE_CONFIG = {
+    "prepare_workers": 2,                              # 同时运行的ffmpeg转换/截取数 | Concurrent ffmpeg converts/cuts
+    "transcribe_workers": SCHEDULE_CONFIG["workers"],  # 同时上传转录的单元数 | Units uploaded for transcription at the same time
+    "finish_workers": 2,                               # 同时进行AI处理和时间戳调整的单元数 | Units post-processed (AI text processing, timestamps) at the same time
+    "queue_size": 4                                    # 每个步骤前最多排队的单元数 | Most units queued in front of each stage
+}
+
+
+# 自适应并发配置 | Adaptive Concurrency Configuration
+# 按延迟和限流情况自动调整同时进行的请求数（AIMD），转录和AI处理分别控制 | Adjust the number of in-flight requests from latency and throttling (AIMD), separately for transcription and AI text processing
+ADAPTIVE_CONFIG = {
+    "enabled": False,            # 是否启用自适应并发 | Whether to enable adaptive concurrency
+    "transcription": {"initial": 4, "min": 1, "max": 16},  # 每个端点转录请求的初始、最小、最大并发数，启用时替代端点的 max_concurrency | Initial, minimum and maximum in-flight transcription requests per endpoint, replacing the endpoint's max_concurrency when enabled
+    "chat": {"initial": 2, "min": 1, "max": 8},            # AI处理请求的初始、最小、最大并发数 | Initial, minimum and maximum in-flight chat requests
+    "decrease": 0.5,             # 遇到限流、超时或延迟升高时并发数乘以该系数 | Factor the limit is multiplied by on throttling, timeouts or rising latency
+    "latency_tolerance": 2.0,    # 延迟超过基线的该倍数视为拥塞 | Latency above this multiple of the baseline counts as congestion
+    "max_error_rate": 0.1,       # 近期错误率低于该值时才增加并发 | The limit only grows while the recent error rate is below this
+    "window": 50                 # 计算错误率的最近请求数 | Number of recent requests used for the error rate
+}
+
+
+# 预估配置（用于 planner.py 预估费用） | Planning Configuration (used by planner.py to estimate cost)
+PLAN_CONFIG = {
+    "price_per_minute": 0.006   # 每分钟音频的转录价格 | Transcription price per minute of audio
+}
+
+
+# 音频预处理配置 | Audio Preprocessing Configuration
+# 去除长静音并加速语音，减少计费的音频分钟数，时间戳会映射回原始音频 | Strip long silences and speed speech up to cut billed minutes, timestamps are mapped back to the original audio
+PREPROCESS_CONFIG = {
+    "enabled": False,            # 是否启用预处理 | Whether to enable preprocessing
+    "silence_threshold": -40,    # 低于该音量（dBFS）视为静音 | Frames quieter than this (dBFS) count as silence
+    "min_silence": 1000,         # 超过该时长的静音会被去除，单位为毫秒 | Silences longer than this are removed, in milliseconds
+    "keep_silence": 200,         # 去除静音时两侧保留的时长，单位为毫秒 | Silence kept on each side of a cut, in milliseconds
+    "speed": 1.0                 # 语音加速倍数，范围0.5-2.0，例如1.25 | Speech tempo factor between 0.5 and 2.0, e.g. 1.25
+}
+
+
+# 全文检索配置 | Full-Text Search Configuration
+# 每个转录文件写入后更新SQLite FTS5索引，可用 search_index.py 检索 | The SQLite FTS5 index is updated as each transcript is written, query it with search_index.py
+INDEX_CONFIG = {
+    "enabled": True,                                                  # 是否更新检索索引 | Whether to update the search index
+    "db_path": os.path.join(OUTPUT_CONFIG["transcripts_dir"], "search_index.db")  # 索引数据库路径 | Index database path
+}
+
+
+# 渐进分段配置 | Progressive Chunking Configuration
+# 第一段很短以尽快得到第一段文本，其余部分按最少的分段数处理 | A short first chunk so the first text arrives quickly, then the rest in as few chunks as it needs
+PROGRESSIVE_CONFIG = {
+    "enabled": False,         # 是否启用渐进分段 | Whether to enable progressive chunking
+    "first_chunk": 60 * 1000, # 第一段时长，单位为毫秒 | Length of the first chunk in milliseconds
+    "growth": 3.0             # 有余量时相邻分段的时长倍数，不会增加调用次数 | Length ratio between consecutive chunks where there is slack, never adds calls
+}
+
+
+# 实时流转录配置 | Live Stream Transcription Configuration
+# stream_transcriber.py 在静音处切分滚动窗口，窗口结束即转录并追加到实时输出 | stream_transcriber.py cuts rolling windows at silences and appends each one to the live output as soon as it is transcribed
+STREAM_CONFIG = {
+    "min_window": 10 * 1000,   # 窗口最短时长，达到后遇到静音即切分，单位为毫秒 | Shortest window, cut at the next silence after this, in milliseconds
+    "max_window": 30 * 1000,   # 窗口最长时长，没有静音时强制切分，单位为毫秒 | Longest window, cut even without a silence, in milliseconds
+    "min_silence": 500,        # 可以切分的最短静音，单位为毫秒 | Shortest silence to cut at, in milliseconds
+    "silence_threshold": -40,  # 低于该音量（dBFS）视为静音 | Frames quieter than this (dBFS) count as silence
+    "workers": 2,              # 同时转录的窗口数 | Windows transcribed at the same time
+    "max_pending": 4           # 最多排队的窗口数，限制内存和延迟 | Most windows in flight, bounding memory and lag
+}
+
+
+# 分布式转录配置 | Distributed Transcription Configuration
+# work_queue.py 把分段任务放入共享存储上的队列，多台机器上的 worker 进程领取并转录 | work_queue.py puts segment tasks in a queue on shared storage, worker processes on any number of hosts claim and transcribe them
+DISTRIBUTED_CONFIG = {
+    "queue_dir": "work_queue",   # 队列目录，多台机器时放在共享存储上 | Queue directory, on shared storage for several hosts
+    "lease": 300,                # 任务租约时长，处理中自动续约，单位为秒 | Task lease in seconds, renewed while the task runs
+    "max_attempts": 3,           # 任务最多尝试次数 | Attempts before a task is marked failed
+    "poll_interval": 2.0         # 没有任务时的等待间隔，单位为秒 | Seconds to wait when no task is available
+}
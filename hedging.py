@@ -0,0 +1,291 @@
+"""
+Hedged requests
+
+Fire a duplicate request when the first one runs longer than a latency
+percentile observed on recent calls, keep whichever answers first and
+cancel the other. The number of duplicate requests is capped by a budget
+relative to the number of primary calls.
+
+Latency is service time per unit of request size (e.g. per MB of audio):
+time spent waiting for a concurrency slot is not counted, and long requests
+are not hedged just for being long.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+
+class AttemptCancelled(Exception):
+    """Raised by an attempt that stopped because the other attempt won"""
+
+
+class CancelEvent(threading.Event):
+    """
+    Cancel signal of one attempt
+
+    Set once the other attempt has won. The request function calls started()
+    when its request is actually sent, and can register callbacks with
+    on_cancel() to abort work in flight, e.g. close its HTTP client.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.started_at = None
+        self.serving = threading.Event()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+
+    def started(self):
+        """Mark the start of service; waiting before this is not latency"""
+        self.started_at = time.monotonic()
+        self.serving.set()
+
+    def on_cancel(self, callback):
+        """
+        Run callback when the attempt is cancelled, at once if it already is
+
+        Returns:
+            Function that unregisters the callback
+        """
+        with self._callback_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._callback_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def set(self):
+        with self._callback_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+
+class LatencyTracker:
+    """Keep a sliding window of recent latencies and answer percentile queries"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Record one observed latency
+
+        Args:
+            seconds: Latency in seconds
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """
+        Get the latency at percentile q
+
+        Args:
+            q: Percentile between 0 and 1, e.g. 0.95
+
+        Returns:
+            float: Latency in seconds, or None if nothing has been recorded
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgedCaller:
+    """
+    Run a request and hedge it with a duplicate when it is slow
+
+    The request function receives a CancelEvent. It must call started() when
+    its request is sent; the hedge delay runs from then. Once the other
+    attempt has won the event is set: the function should not send if it has
+    not yet, and abort a request in flight through on_cancel().
+    """
+
+    def __init__(self, percentile=0.95, window=200, min_samples=20,
+                 min_delay=1.0, max_extra_ratio=0.1):
+        """
+        Args:
+            percentile: Latency percentile after which a duplicate is fired
+            window: Number of recent calls used to estimate the percentile
+            min_samples: Calls to observe before hedging starts
+            min_delay: Lower bound of the hedge delay in seconds, whatever the size
+            max_extra_ratio: Maximum ratio of duplicate to primary requests
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_extra_ratio = max_extra_ratio
+        self.tracker = LatencyTracker(window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self, size=1.0):
+        """
+        Get the service time after which a call of this size would be hedged
+
+        Args:
+            size: Request size, in the unit latencies are normalised by
+
+        Returns:
+            float: Delay in seconds, or None while there are too few samples
+        """
+        if len(self.tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, self.tracker.percentile(self.percentile) * size)
+
+    def _take_budget(self):
+        """Reserve one duplicate request if the budget allows it"""
+        with self._lock:
+            if self.hedges + 1 > self.max_extra_ratio * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def _start(self, fn, cancel_event, size, primary):
+        """Run one attempt in a daemon thread and return its Future"""
+        future = Future()
+
+        def run():
+            try:
+                result = fn(cancel_event)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                cancel_event.serving.set()
+
+            if cancel_event.started_at is not None and (error is None or cancel_event.is_set()):
+                # A cancelled primary was at least this slow; dropping it would
+                # bias the tail down. A cancelled duplicate says nothing.
+                if primary or not cancel_event.is_set():
+                    elapsed = time.monotonic() - cancel_event.started_at
+                    self.tracker.record(elapsed / max(size, 1e-9))
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def call(self, fn, size=1.0):
+        """
+        Call fn, firing a duplicate if its service time runs past the hedge delay
+
+        Args:
+            fn: Request function taking a CancelEvent
+            size: Request size latency is normalised by, e.g. MB of audio
+
+        Returns:
+            The result of the first attempt that succeeds
+
+        Raises:
+            Exception: The first error, if every attempt failed
+        """
+        with self._lock:
+            self.calls += 1
+        delay = self.hedge_delay(size)
+
+        primary_cancel = CancelEvent()
+        primary = self._start(fn, primary_cancel, size, primary=True)
+        attempts = {primary: primary_cancel}
+
+        if delay is not None:
+            # Time the primary from when it is sent, not while it waits for a slot
+            primary_cancel.serving.wait()
+            served = time.monotonic() - (primary_cancel.started_at or time.monotonic())
+            done, _ = wait([primary], timeout=max(0.0, delay - served))
+            if not done and self._take_budget():
+                hedge_cancel = CancelEvent()
+                attempts[self._start(fn, hedge_cancel, size, primary=False)] = hedge_cancel
+
+        pending = set(attempts)
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                # Cancel the losing attempt
+                for other, cancel_event in attempts.items():
+                    if other is not future:
+                        cancel_event.set()
+                if future is not primary:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return future.result()
+        raise first_error
+
+    def stats(self):
+        """
+        Get hedging counters
+
+        Returns:
+            dict: Primary calls, duplicates fired, duplicate wins and current delay per unit size
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_delay": self.hedge_delay(),
+            }
+
+
+if __name__ == "__main__":
+    # Test case: stub request with injected tail latency
+    import random
+
+    def stub_request(cancel_event):
+        cancel_event.started()
+        # 5% of calls are ten times slower than the median
+        latency = 0.02 * (10 if random.random() < 0.05 else 1) * random.uniform(0.8, 1.2)
+        if cancel_event.wait(latency):
+            raise AttemptCancelled()
+        return "ok"
+
+    def measure(caller, n=400):
+        latencies = []
+        for _ in range(n):
+            started = time.monotonic()
+            if caller is None:
+                stub_request(CancelEvent())
+            else:
+                caller.call(stub_request)
+            latencies.append(time.monotonic() - started)
+        latencies.sort()
+        return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+    random.seed(0)
+    p50, p99 = measure(None)
+    print(f"Without hedging: p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+
+    random.seed(0)
+    caller = HedgedCaller(percentile=0.9, min_samples=20, min_delay=0.0, max_extra_ratio=0.1)
+    p50, p99 = measure(caller)
+    print(f"With hedging:    p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+    print(f"Hedging stats: {caller.stats()}")
@@ -0,0 +1,154 @@
+"""
+Per-job configuration
+
+A JobConfig carries everything one transcription job reads: the Whisper
+endpoint, audio, output and AI settings. It is immutable, so one process can
+run jobs with different languages, formats or endpoints at the same time
+without one job's settings leaking into another. Every job built with
+create or with_overrides gets its own temporary directories, so concurrent
+jobs never clean up or overwrite each other's chunks. The dicts in
+config.py are only the defaults, used as they are by default_job().
+
+Usage:
+    job = JobConfig.create(job_id="tenant-a", audio={"language": "zh", "response_format": "text"})
+    transcribe_audio("meeting.m4a", job=job)
+"""
+
+import uuid
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+from config import OPENAI_CONFIG, AUDIO_CONFIG, OUTPUT_CONFIG, AI_CONFIG
+
+# Output keys holding per-job temporary directories
+TEMP_DIRS = ("audio_chunks_dir", "trans_chunks_dir")
+
+
+def _merge(defaults, overrides):
+    """
+    Overlay overrides on defaults as a read-only mapping
+
+    Raises:
+        ValueError: If overrides contain a key the defaults don't have
+    """
+    overrides = dict(overrides or {})
+    unknown = set(overrides) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown configuration keys: {', '.join(sorted(unknown))}")
+    merged = dict(defaults)
+    merged.update(overrides)
+    return MappingProxyType(merged)
+
+
+def _with_temp_dirs(output, run_id):
+    """Suffix the temporary directories in output with a run id"""
+    output = dict(output)
+    for key in TEMP_DIRS:
+        output[key] = f"{output[key]}_{run_id}"
+    return MappingProxyType(output)
+
+
+def _new_run_id(job_id):
+    """Unique id of one job, prefixed with its name when it has one"""
+    suffix = uuid.uuid4().hex[:8]
+    return suffix if job_id is None else f"{job_id}_{suffix}"
+
+
+class JobConfig(NamedTuple):
+    """Immutable configuration of one transcription job"""
+
+    openai: Mapping   # Whisper endpoint, keys of OPENAI_CONFIG
+    audio: Mapping    # Keys of AUDIO_CONFIG
+    output: Mapping   # Keys of OUTPUT_CONFIG
+    ai: Mapping       # Keys of AI_CONFIG
+    job_id: str = None  # Optional job name
+    run_id: str = None  # Suffix of this job's temporary directories
+
+    @classmethod
+    def create(cls, job_id=None, openai=None, audio=None, output=None, ai=None):
+        """
+        Build a job configuration from the config.py defaults
+
+        Args:
+            job_id: Optional job name, included in the temporary directory
+                names; the directories are unique to the job either way
+            openai: Overrides for OPENAI_CONFIG
+            audio: Overrides for AUDIO_CONFIG
+            output: Overrides for OUTPUT_CONFIG
+            ai: Overrides for AI_CONFIG
+
+        Returns:
+            JobConfig: The job configuration
+
+        Raises:
+            ValueError: If an override has an unknown key
+        """
+        run_id = _new_run_id(job_id)
+        return cls(
+            openai=_merge(OPENAI_CONFIG, openai),
+            audio=_merge(AUDIO_CONFIG, audio),
+            output=_with_temp_dirs(_merge(OUTPUT_CONFIG, output), run_id),
+            ai=_merge(AI_CONFIG, ai),
+            job_id=job_id,
+            run_id=run_id,
+        )
+
+    def with_overrides(self, openai=None, audio=None, output=None, ai=None):
+        """
+        Derive a new job configuration with some settings changed
+
+        The new job keeps this job's name but gets its own temporary directories.
+
+        Returns:
+            JobConfig: A new configuration, this one is unchanged
+        """
+        base = dict(self.output)
+        if self.run_id is not None:
+            # Back to the directories before this job's suffix
+            for key in TEMP_DIRS:
+                base[key] = base[key][:-len(self.run_id) - 1]
+        run_id = _new_run_id(self.job_id)
+        return JobConfig(
+            openai=_merge(self.openai, openai),
+            audio=_merge(self.audio, audio),
+            output=_with_temp_dirs(_merge(base, output), run_id),
+            ai=_merge(self.ai, ai),
+            job_id=self.job_id,
+            run_id=run_id,
+        )
+
+
+def default_job():
+    """
+    Job configuration from the current config.py dicts
+
+    Read on every call, so changes made to the dicts at runtime still apply
+    to calls that don't pass a job. Uses the temporary directories from
+    OUTPUT_CONFIG as they are, so every call without a job shares them;
+    concurrent jobs should be built with JobConfig.create.
+
+    Returns:
+        JobConfig: The default job configuration
+    """
+    return JobConfig(
+        openai=_merge(OPENAI_CONFIG, None),
+        audio=_merge(AUDIO_CONFIG, None),
+        output=_merge(OUTPUT_CONFIG, None),
+        ai=_merge(AI_CONFIG, None),
+    )
+
+
+if __name__ == "__main__":
+    # Test case: two jobs with different settings side by side, each with its own temporary directories
+    english = JobConfig.create(job_id="a", audio={"language": "en", "response_format": "srt"})
+    chinese = english.with_overrides(audio={"language": "zh", "response_format": "text"})
+    print(english.audio["language"], english.audio["response_format"], english.output["audio_chunks_dir"])
+    print(chinese.audio["language"], chinese.audio["response_format"], chinese.output["audio_chunks_dir"])
+
+    try:
+        english.audio["language"] = "fr"
+    except TypeError as e:
+        print(f"Read-only: {e}")
+    try:
+        JobConfig.create(audio={"langauge": "fr"})
+    except ValueError as e:
+        print(e)
@@ -0,0 +1,170 @@
+"""
+Staged producer/consumer pipeline
+
+Run items through a chain of stages connected by bounded queues. Every stage
+has its own pool of worker threads, so different kinds of work overlap: one
+segment is uploading while ffmpeg is still cutting the next ones, and one
+file is transcoding while another is in LLM post-processing. A full queue
+blocks the stage feeding it, so a fast stage never runs far ahead of a slow
+one and the number of items in flight stays bounded.
+"""
+
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One pipeline stage
+
+    fn is called as fn(item, value), where value is what the previous stage
+    returned (None for the first stage), and returns the value for the next one.
+    """
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+
+
+def run_pipeline(items, stages, on_done, queue_size=4, skip=None):
+    """
+    Run items through the stages in order
+
+    An item that raises in a stage skips the remaining stages. If on_done
+    raises, no further items are started: the workers finish the item in
+    hand, drop the rest and exit before the exception is re-raised, so no
+    stage keeps running after run_pipeline returns.
+
+    Args:
+        items: Items to process, fed to the first stage in order
+        stages: Stage list
+        on_done: Called in the calling thread as on_done(item, result, error)
+        queue_size: Capacity of the queue in front of each stage
+        skip: Optional predicate; items for which it returns True skip the
+            remaining stages and reach on_done with a None result
+
+    Returns:
+        dict: Per-stage statistics, {name: {"items": n, "busy": seconds}}
+    """
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+    results = queue.Queue()
+    remaining = [stage.workers for stage in stages]
+    stats = {stage.name: {"items": 0, "busy": 0.0} for stage in stages}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def feed():
+        for item in items:
+            if stop.is_set():
+                break
+            queues[0].put((item, None))
+        for _ in range(stages[0].workers):
+            queues[0].put(_DONE)
+
+    def work(position, stage):
+        while True:
+            entry = queues[position].get()
+            if entry is _DONE:
+                break
+            item, value = entry
+            if stop.is_set():
+                # Drain without processing
+                continue
+            if skip is not None and skip(item):
+                results.put((item, None, None))
+                continue
+
+            started = time.monotonic()
+            try:
+                value = stage.fn(item, value)
+                error = None
+            except Exception as e:
+                error = e
+            with lock:
+                stats[stage.name]["items"] += 1
+                stats[stage.name]["busy"] += time.monotonic() - started
+
+            if error is not None:
+                results.put((item, None, error))
+            elif position + 1 < len(stages):
+                # Blocks while the next stage is behind
+                queues[position + 1].put((item, value))
+            else:
+                results.put((item, value, None))
+
+        # The last worker of a stage to finish shuts the next stage down
+        with lock:
+            remaining[position] -= 1
+            last = remaining[position] == 0
+        if not last:
+            return
+        if position + 1 < len(stages):
+            for _ in range(stages[position + 1].workers):
+                queues[position + 1].put(_DONE)
+        else:
+            results.put(_DONE)
+
+    if not stages:
+        raise ValueError("A pipeline needs at least one stage")
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for position, stage in enumerate(stages):
+        threads += [
+            threading.Thread(target=work, args=(position, stage), daemon=True, name=f"{stage.name}-{i}")
+            for i in range(stage.workers)
+        ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            entry = results.get()
+            if entry is _DONE:
+                break
+            on_done(*entry)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    return stats
+
+
+if __name__ == "__main__":
+    # Test case: cut, upload and post-process stages of different speeds
+    cut_seconds, upload_seconds, post_seconds = 0.05, 0.2, 0.1
+    segments = list(range(12))
+    events = []
+
+    def stage_fn(name, seconds):
+        def fn(item, value):
+            events.append((time.monotonic(), name, item))
+            time.sleep(seconds)
+            return item
+        return fn
+
+    started = time.monotonic()
+    stats = run_pipeline(
+        segments,
+        [
+            Stage("cut", stage_fn("cut", cut_seconds), workers=1),
+            Stage("upload", stage_fn("upload", upload_seconds), workers=4),
+            Stage("post", stage_fn("post", post_seconds), workers=2),
+        ],
+        on_done=lambda item, result, error: None,
+        queue_size=2
+    )
+    elapsed = time.monotonic() - started
+
+    sequential = len(segments) * (cut_seconds + upload_seconds + post_seconds)
+    first_upload = min(t for t, name, item in events if name == "upload" and item == 0)
+    last_cut = max(t for t, name, item in events if name == "cut")
+    print(f"Sequential: {sequential:.2f}s, pipelined: {elapsed:.2f}s")
+    print(f"Segment 0 upload started {last_cut - first_upload:.2f}s before the last cut")
+    for name, stage_stats in stats.items():
+        print(f"{name}: {stage_stats['items']} items, busy {stage_stats['busy']:.2f}s")
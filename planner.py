@@ -0,0 +1,159 @@
+"""
+Dry-run planner
+
+Probe every input and simulate the convert/split decisions transcribe_audio
+makes, then report per-file and total API calls, upload bytes, audio minutes,
+estimated cost and wall time under a given concurrency. Only ffprobe is run:
+the API is never called and no chunks are written.
+
+With PREPROCESS_CONFIG enabled the audio is planned at the configured speed.
+Silence removal can't be known without decoding, so minutes, calls and cost
+are upper bounds in that case and the plan says so.
+
+Usage:
+    python planner.py path/to/audio [--workers 8] [--policy spt] [--json]
+"""
+
+import argparse
+import json
+import os
+from config import AUDIO_CONFIG, SCHEDULE_CONFIG, PLAN_CONFIG, PROGRESSIVE_CONFIG, PREPROCESS_CONFIG
+from scheduler import POLICIES, plan_file_units, parse_bitrate, order_units, simulate
+from whisper_sample import get_supported_audio_files, get_audio_info, get_transcribe_workers
+
+
+def plan_file(file_index, audio_file, duration, file_size):
+    """
+    Plan a single file
+
+    Args:
+        file_index: Index of the file in the batch
+        audio_file: Audio file path
+        duration: Duration in seconds
+        file_size: File size in bytes
+
+    Returns:
+        tuple: (file plan dict, WorkUnit list)
+    """
+    if PREPROCESS_CONFIG["enabled"]:
+        # transcribe_audio uploads the sped-up MP3, without the silences it removes
+        duration = duration / PREPROCESS_CONFIG["speed"]
+        file_size = int(duration * parse_bitrate(AUDIO_CONFIG["mp3_bitrate"]) / 8)
+    units = plan_file_units(file_index, audio_file, duration, file_size, AUDIO_CONFIG, PROGRESSIVE_CONFIG)
+    kind = units[0].kind
+    if units[0].stream_copy:
+        # Progressive slices of a small file are cut without re-encoding
+        action = "split"
+    else:
+        action = {"direct": "upload", "convert": "convert", "segment": "convert+split"}[kind]
+    if kind == "direct" or units[0].stream_copy:
+        upload_bytes = file_size
+    else:
+        # Converted and cut audio is uploaded at the target bitrate
+        upload_bytes = int(duration * parse_bitrate(AUDIO_CONFIG["mp3_bitrate"]) / 8)
+
+    api_calls = len(units)
+    chat_calls = api_calls if AUDIO_CONFIG["response_format"] == "text" else 0
+    audio_minutes = duration / 60
+    return {
+        "file": audio_file,
+        "action": action,
+        "duration": duration,
+        "file_size": file_size,
+        "segments": len(units) if kind == "segment" else 0,
+        "api_calls": api_calls,
+        "chat_calls": chat_calls,
+        "upload_bytes": upload_bytes,
+        "audio_minutes": audio_minutes,
+        "cost": audio_minutes * PLAN_CONFIG["price_per_minute"],
+    }, units
+
+
+def plan_batch(audio_path, workers=None, policy=None):
+    """
+    Build a dry-run plan for a file or directory
+
+    Args:
+        audio_path: File or directory path
+        workers: Concurrency, defaults to the upload workers transcribe_audio runs
+        policy: Scheduling policy, defaults to SCHEDULE_CONFIG["policy"]
+
+    Returns:
+        dict: files (per-file plans), skipped (files that could not be probed) and totals
+    """
+    workers = workers or get_transcribe_workers()
+    policy = policy or SCHEDULE_CONFIG["policy"]
+
+    files = []
+    skipped = []
+    units = []
+    for file_index, audio_file in enumerate(get_supported_audio_files(audio_path)):
+        try:
+            duration, _ = get_audio_info(audio_file, verbose=False)
+        except Exception as e:
+            skipped.append({"file": audio_file, "error": str(e)})
+            continue
+        file_plan, file_units = plan_file(file_index, audio_file, duration, os.path.getsize(audio_file))
+        files.append(file_plan)
+        units += file_units
+
+    units = order_units(units, policy, SCHEDULE_CONFIG, in_file_order=PROGRESSIVE_CONFIG["enabled"])
+    prediction = simulate(units, workers, SCHEDULE_CONFIG)
+    for file_plan in files:
+        file_plan["completion"] = prediction["file_completion"][file_plan["file"]]
+
+    totals = {
+        key: sum(file_plan[key] for file_plan in files)
+        for key in ("api_calls", "chat_calls", "upload_bytes", "audio_minutes", "cost")
+    }
+    totals.update({
+        "files": len(files),
+        "workers": workers,
+        "policy": policy,
+        "wall_time": prediction["makespan"],
+        "mean_completion": prediction["mean_completion"],
+        # Removed silences are unknown until decoding, so the estimates are upper bounds
+        "preprocess": PREPROCESS_CONFIG["enabled"],
+    })
+    return {"files": files, "skipped": skipped, "totals": totals}
+
+
+def print_plan(plan):
+    """Print a plan as a table"""
+    print(f"\n{'file':<40} {'action':<14} {'minutes':>8} {'calls':>6} {'upload MB':>10} {'cost':>8} {'done at':>9}")
+    for file_plan in plan["files"]:
+        print(f"{os.path.basename(file_plan['file'])[:40]:<40} "
+              f"{file_plan['action']:<14} "
+              f"{file_plan['audio_minutes']:>8.1f} "
+              f"{file_plan['api_calls']:>6} "
+              f"{file_plan['upload_bytes']/1024/1024:>10.1f} "
+              f"{file_plan['cost']:>8.3f} "
+              f"{file_plan['completion']:>8.0f}s")
+    for skipped in plan["skipped"]:
+        print(f"Skipped {skipped['file']}: {skipped['error']}")
+
+    totals = plan["totals"]
+    print(f"\nFiles: {totals['files']}")
+    print(f"Whisper API calls: {totals['api_calls']}, chat calls: {totals['chat_calls']}")
+    print(f"Upload: {totals['upload_bytes']/1024/1024:.1f}MB, audio: {totals['audio_minutes']:.1f} minutes")
+    print(f"Estimated cost: {totals['cost']:.2f}")
+    print(f"Estimated wall time with {totals['workers']} workers ({totals['policy']}): "
+          f"{totals['wall_time']:.0f}s, mean file completion {totals['mean_completion']:.0f}s")
+    if totals["preprocess"]:
+        print(f"Preprocessing is enabled: audio is planned at {PREPROCESS_CONFIG['speed']}x speed; "
+              f"removed silences will lower minutes, calls and cost further")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate API calls, upload bytes, cost and time without transcribing")
+    parser.add_argument("path", help="Audio file or directory")
+    parser.add_argument("--workers", type=int, help="Concurrency, defaults to the upload workers transcribe_audio runs")
+    parser.add_argument("--policy", choices=POLICIES, help="Scheduling policy, defaults to SCHEDULE_CONFIG['policy']")
+    parser.add_argument("--json", action="store_true", help="Print the plan as JSON")
+    args = parser.parse_args()
+
+    plan = plan_batch(args.path, workers=args.workers, policy=args.policy)
+    if args.json:
+        print(json.dumps(plan, indent=2, ensure_ascii=False))
+    else:
+        print_plan(plan)
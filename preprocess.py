@@ -0,0 +1,285 @@
+"""
+Silence removal and tempo compression
+
+Strip long silences and optionally speed speech up before upload, so fewer
+audio minutes are billed and files need fewer segments. The audio is decoded
+to 16kHz mono PCM and cut in 10ms frames, so every kept piece starts on an
+exact millisecond; a piecewise TimeMap records where each piece came from
+and maps SRT/VTT timestamps of the processed audio back to the original
+timeline.
+"""
+
+import bisect
+import math
+import re
+import subprocess
+from collections import deque
+
+try:
+    import audioop
+except ImportError:
+    from pydub import pyaudioop as audioop
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FRAME_MS = 10
+BYTES_PER_MS = SAMPLE_RATE * SAMPLE_WIDTH // 1000
+FRAME_BYTES = FRAME_MS * BYTES_PER_MS
+
+
+class TimeMap:
+    """
+    Piecewise map from the processed timeline back to the original one
+
+    Each piece is a run of original audio kept without a cut. Processed time
+    is divided by speed, since tempo compression is applied after cutting.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.processed_starts = []  # Piece start in the cut audio, before tempo change (ms)
+        self.original_starts = []   # Piece start in the original audio (ms)
+        self.processed_ms = 0       # Length of the cut audio (ms)
+        self.original_ms = 0        # Length of the original audio (ms)
+
+    def add(self, original_ms, length_ms):
+        """
+        Record that original audio [original_ms, original_ms + length_ms) was kept
+
+        Args:
+            original_ms: Start in the original audio
+            length_ms: Length in milliseconds
+        """
+        if not self.original_starts or original_ms != self._original_end():
+            self.processed_starts.append(self.processed_ms)
+            self.original_starts.append(original_ms)
+        self.processed_ms += length_ms
+        self.original_ms = max(self.original_ms, original_ms + length_ms)
+
+    def _original_end(self):
+        return self.original_starts[-1] + self.processed_ms - self.processed_starts[-1]
+
+    def to_original(self, ms):
+        """
+        Map a time in the processed audio to the original audio
+
+        Args:
+            ms: Time in the processed (cut and sped up) audio in milliseconds
+
+        Returns:
+            int: Time in the original audio in milliseconds
+        """
+        if not self.processed_starts:
+            return ms
+        cut_ms = min(ms * self.speed, self.processed_ms)
+        index = max(0, bisect.bisect_right(self.processed_starts, cut_ms) - 1)
+        return int(round(self.original_starts[index] + cut_ms - self.processed_starts[index]))
+
+    def to_processed(self, ms):
+        """
+        Map a kept time in the original audio to the processed audio
+
+        Args:
+            ms: Time in the original audio in milliseconds
+
+        Returns:
+            float: Time in the processed audio in milliseconds
+        """
+        if not self.original_starts:
+            return ms
+        index = max(0, bisect.bisect_right(self.original_starts, ms) - 1)
+        return (self.processed_starts[index] + ms - self.original_starts[index]) / self.speed
+
+    def output_ms(self):
+        """Length of the processed audio after tempo change in milliseconds"""
+        return int(self.processed_ms / self.speed)
+
+
+def strip_silence(reader, writer, silence_threshold, min_silence, keep_silence, speed=1.0):
+    """
+    Copy 16kHz mono s16le PCM from reader to writer without long silences
+
+    Silences of at least min_silence are cut, keeping keep_silence at each
+    edge so words are not clipped. Memory stays bounded by min_silence.
+
+    Args:
+        reader: Binary file object with PCM input
+        writer: Binary file object for PCM output
+        silence_threshold: Frames quieter than this (dBFS) count as silence
+        min_silence: Shortest silence that is cut, in milliseconds
+        keep_silence: Silence kept on each side of a cut, in milliseconds
+        speed: Tempo factor applied to the output afterwards
+
+    Returns:
+        TimeMap: Map from the processed timeline to the original one
+    """
+    time_map = TimeMap(speed)
+    keep_frames = keep_silence // FRAME_MS
+    min_frames = max(min_silence // FRAME_MS, 2 * keep_frames + 1)
+    threshold_rms = 32768 * 10 ** (silence_threshold / 20)
+
+    pending = []                    # Silent frames while the silence may still be short
+    tail = deque(maxlen=keep_frames)  # Last frames of a long silence
+    long_silence = False
+    position_ms = 0
+
+    def emit(frame_ms, frame):
+        time_map.add(frame_ms, len(frame) // BYTES_PER_MS)
+        writer.write(frame)
+
+    while True:
+        frame = reader.read(FRAME_BYTES)
+        if len(frame) < BYTES_PER_MS:
+            break
+        frame = frame[:len(frame) - len(frame) % BYTES_PER_MS]
+        frame_ms = position_ms
+        position_ms += len(frame) // BYTES_PER_MS
+
+        if audioop.rms(frame, SAMPLE_WIDTH) < threshold_rms:
+            if long_silence:
+                if keep_frames:
+                    tail.append((frame_ms, frame))
+                continue
+            pending.append((frame_ms, frame))
+            if len(pending) >= min_frames:
+                # The silence is long: keep its head, drop the middle
+                for kept in pending[:keep_frames]:
+                    emit(*kept)
+                if keep_frames:
+                    tail.extend(pending[-keep_frames:])
+                pending = []
+                long_silence = True
+            continue
+
+        # Speech: flush what is kept of the preceding silence
+        for kept in (tail if long_silence else pending):
+            emit(*kept)
+        pending = []
+        tail.clear()
+        long_silence = False
+        emit(frame_ms, frame)
+
+    # A short trailing silence is kept, a long one only keeps its head
+    for kept in pending:
+        emit(*kept)
+    time_map.original_ms = max(time_map.original_ms, position_ms)
+    return time_map
+
+
+def preprocess_audio(input_file, output_path, preprocess_config, bitrate):
+    """
+    Remove silences and change tempo with ffmpeg, encoding the result as mono MP3
+
+    Args:
+        input_file: Input audio file path
+        output_path: Output MP3 file path
+        preprocess_config: Dict with silence_threshold, min_silence, keep_silence and speed
+        bitrate: Target MP3 bitrate, e.g. "96k"
+
+    Returns:
+        TimeMap: Map from the processed timeline to the original one
+
+    Raises:
+        RuntimeError: If ffmpeg fails
+        ValueError: If speed is outside the range atempo supports
+    """
+    speed = preprocess_config["speed"]
+    if not 0.5 <= speed <= 2.0:
+        raise ValueError(f"speed must be between 0.5 and 2.0: {speed}")
+
+    decode_cmd = [
+        "ffmpeg", "-v", "error",
+        "-i", input_file,
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "-"
+    ]
+    encode_cmd = [
+        "ffmpeg", "-v", "error",
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "-i", "-"
+    ]
+    if speed != 1.0:
+        encode_cmd += ["-af", f"atempo={speed}"]
+    encode_cmd += ["-b:a", bitrate, "-y", output_path]
+
+    decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        time_map = strip_silence(
+            decoder.stdout, encoder.stdin,
+            preprocess_config["silence_threshold"],
+            preprocess_config["min_silence"],
+            preprocess_config["keep_silence"],
+            speed
+        )
+    finally:
+        encoder.stdin.close()
+        decoder.stdout.close()
+        decoder.wait()
+        encoder.wait()
+
+    if decoder.returncode != 0 or encoder.returncode != 0:
+        raise RuntimeError(f"Audio preprocessing failed: {input_file}")
+    return time_map
+
+
+def format_ms(ms, separator=","):
+    """Format milliseconds as HH:MM:SS,mmm (or HH:MM:SS.mmm for VTT)"""
+    return f"{ms // 3600000:02d}:{ms % 3600000 // 60000:02d}:{ms % 60000 // 1000:02d}{separator}{ms % 1000:03d}"
+
+
+def remap_timestamps(content, time_map):
+    """
+    Map SRT/VTT cue timestamps of the processed audio back to the original timeline
+
+    Args:
+        content: Subtitle content already offset to the processed timeline
+        time_map: TimeMap returned by preprocess_audio
+
+    Returns:
+        str: Subtitle content in original time
+    """
+    pattern = r'(\d{2}):(\d{2}):(\d{2})([,.])(\d{3})'
+
+    def replace_timestamp(match):
+        h, m, s, separator, ms = match.groups()
+        total_ms = int(h) * 3600000 + int(m) * 60000 + int(s) * 1000 + int(ms)
+        return format_ms(time_map.to_original(total_ms), separator)
+
+    def replace_cue(match):
+        return re.sub(pattern, replace_timestamp, match.group(0))
+
+    return re.sub(pattern + r' --> ' + pattern, replace_cue, content)
+
+
+if __name__ == "__main__":
+    # Test case: synthetic speech/silence pattern, checking the map is exact
+    import io
+    import struct
+
+    def tone(ms, amplitude):
+        samples = ms * SAMPLE_RATE // 1000
+        return struct.pack(f"<{samples}h", *(
+            int(amplitude * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)) for i in range(samples)
+        ))
+
+    # (length in ms, is speech)
+    pattern = [(3000, True), (5000, False), (2000, True), (400, False), (1500, True), (12000, False), (2500, True)]
+    pcm = b"".join(tone(ms, 8000 if speech else 0) for ms, speech in pattern)
+    output = io.BytesIO()
+    time_map = strip_silence(io.BytesIO(pcm), output, -40, 1000, 200, speed=1.25)
+
+    print(f"Original: {time_map.original_ms}ms, after cutting: {time_map.processed_ms}ms, "
+          f"after tempo: {time_map.output_ms()}ms "
+          f"({100 - 100 * time_map.output_ms() / time_map.original_ms:.0f}% fewer minutes)")
+
+    # Each speech start in the original must be recovered from the processed timeline
+    original_start = 0
+    for ms, speech in pattern:
+        if speech:
+            processed = time_map.to_processed(original_start)
+            print(f"speech at {original_start}ms -> processed {processed:.1f}ms -> {time_map.to_original(processed)}ms")
+        original_start += ms
+
+    srt = f"1\n{format_ms(0)} --> {format_ms(int(2000 / 1.25))}\nhello\n"
+    print(remap_timestamps(srt, time_map))
@@ -0,0 +1,371 @@
+"""
+Multi-endpoint routing
+
+Spread requests over several OpenAI-compatible endpoints. Each request goes
+to the healthy endpoint with the fewest outstanding requests relative to its
+weight, endpoints are ejected for a cool-down after consecutive errors, and
+a request that failed because of the endpoint (connection errors, timeouts,
+HTTP 429 and 5xx) is retried transparently on another endpoint. Other errors,
+such as a 400 for a corrupt file, are raised at once without touching the
+endpoint's health. When every endpoint failed, all are tried again after a
+back-off; the SDK's own retries are off so every 429 is seen here.
+
+With adaptive concurrency, each endpoint has its own AIMD limiter that sets
+how many requests it is sent at once, in place of max_concurrency. The
+limiter is fed the outcome and service time of every attempt on that
+endpoint, excluding time spent waiting for a slot.
+"""
+
+import threading
+import time
+from openai import OpenAI
+from concurrency import AdaptiveLimiter, classify_error
+
+
+class NoEndpointAvailable(Exception):
+    """Raised when no endpoint is left to try for a request"""
+
+
+def is_endpoint_error(error):
+    """
+    Check whether an error says the endpoint is unhealthy
+
+    Args:
+        error: Exception raised by a request
+
+    Returns:
+        bool: True for connection errors, timeouts, HTTP 429 and 5xx
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or "Connection" in name or "Timeout" in name
+
+
+class Endpoint:
+    """One OpenAI-compatible endpoint and its routing state"""
+
+    def __init__(self, base_url, api_key, weight=1, max_concurrency=4, name=None, limiter=None):
+        """
+        Args:
+            base_url: API base URL
+            api_key: API key
+            weight: Relative share of requests
+            max_concurrency: Maximum number of in-flight requests, unless limiter is set
+            name: Name used in logs, defaults to base_url
+            limiter: Optional AdaptiveLimiter setting the number of in-flight requests
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.name = name or base_url
+        self.limiter = limiter
+        self.outstanding = 0
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._client = None
+
+    @property
+    def client(self):
+        """OpenAI client for this endpoint, created on first use"""
+        if self._client is None:
+            # Retries are done by the router, so throttling reaches the limiter
+            self._client = OpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0)
+        return self._client
+
+    def capacity(self):
+        """Number of requests this endpoint may have in flight"""
+        if self.limiter is not None:
+            return self.limiter.current_limit()
+        return self.max_concurrency
+
+    def is_ejected(self, now):
+        return now < self.ejected_until
+
+    def load(self):
+        """Outstanding requests relative to weight, counting the next one"""
+        return (self.outstanding + 1) / self.weight
+
+
+class EndpointRouter:
+    """Route requests to endpoints by least outstanding requests with failover"""
+
+    def __init__(self, endpoints, max_errors=3, cooldown=60.0, retries=2):
+        """
+        Args:
+            endpoints: List of Endpoint
+            max_errors: Consecutive errors after which an endpoint is ejected
+            cooldown: Seconds an ejected endpoint is kept out of rotation
+            retries: Rounds over all endpoints after every endpoint failed
+        """
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = endpoints
+        self.max_errors = max_errors
+        self.cooldown = cooldown
+        self.retries = retries
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, endpoint_configs, router_config, adaptive_config=None):
+        """
+        Build a router from configuration dicts
+
+        Args:
+            endpoint_configs: List of dicts with base_url, api_key, weight, max_concurrency
+            router_config: Dict with max_errors, cooldown and retries
+            adaptive_config: Optional ADAPTIVE_CONFIG; when enabled each endpoint
+                gets its own limiter from its "transcription" limits
+
+        Returns:
+            EndpointRouter: Router over the configured endpoints
+        """
+        endpoints = []
+        for config in endpoint_configs:
+            name = config.get("name") or config["base_url"]
+            limiter = None
+            if adaptive_config is not None and adaptive_config["enabled"]:
+                limiter = AdaptiveLimiter.from_config(f"transcription {name}", adaptive_config["transcription"], adaptive_config)
+            endpoints.append(Endpoint(
+                base_url=config["base_url"],
+                api_key=config["api_key"],
+                weight=config.get("weight", 1),
+                max_concurrency=config.get("max_concurrency", 4),
+                name=name,
+                limiter=limiter
+            ))
+        return cls(endpoints, max_errors=router_config["max_errors"], cooldown=router_config["cooldown"],
+                   retries=router_config.get("retries", 2))
+
+    def acquire(self, exclude=()):
+        """
+        Reserve a slot on the least loaded healthy endpoint, waiting if all are busy
+
+        Args:
+            exclude: Endpoints already tried for this request
+
+        Returns:
+            Endpoint: The reserved endpoint
+
+        Raises:
+            NoEndpointAvailable: If every endpoint has been excluded
+        """
+        with self._cond:
+            while True:
+                candidates = [ep for ep in self.endpoints if ep not in exclude]
+                if not candidates:
+                    raise NoEndpointAvailable("All endpoints have been tried")
+                now = time.monotonic()
+                healthy = [ep for ep in candidates if not ep.is_ejected(now)]
+                free = [ep for ep in healthy if ep.outstanding < ep.capacity()]
+                if free:
+                    endpoint = min(free, key=lambda ep: (ep.load(), -ep.weight))
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+                if healthy:
+                    # Wait for a request to finish
+                    self._cond.wait()
+                else:
+                    # Every candidate is ejected, wait for the first cool-down to end
+                    self._cond.wait(min(ep.ejected_until for ep in candidates) - now)
+
+    def release(self, endpoint, success):
+        """
+        Release a slot and update the endpoint's health
+
+        Args:
+            endpoint: Endpoint returned by acquire
+            success: Whether the request succeeded, None to leave the health unchanged
+        """
+        with self._cond:
+            endpoint.outstanding -= 1
+            if success:
+                endpoint.consecutive_errors = 0
+            elif success is not None:
+                endpoint.errors += 1
+                endpoint.consecutive_errors += 1
+                if endpoint.consecutive_errors >= self.max_errors:
+                    endpoint.ejected_until = time.monotonic() + self.cooldown
+                    # After the cool-down a single error ejects it again
+                    endpoint.consecutive_errors = self.max_errors - 1
+                    print(f"Endpoint ejected for {self.cooldown}s: {endpoint.name}")
+            self._cond.notify_all()
+
+    def call(self, fn, size=1.0):
+        """
+        Run fn against an endpoint, failing over to the others on endpoint errors
+
+        Args:
+            fn: Function taking an OpenAI client
+            size: Request size the endpoint limiters normalise latency by, e.g. MB of audio
+
+        Returns:
+            The result of fn
+
+        Raises:
+            Exception: An error that is not an endpoint error, at once; otherwise
+                the last error if every endpoint failed
+        """
+        last_error = None
+        for attempt_round in range(self.retries + 1):
+            if attempt_round:
+                # Every endpoint failed, back off before trying them all again
+                time.sleep(2 ** (attempt_round - 1))
+            tried = []
+            while len(tried) < len(self.endpoints):
+                endpoint = self.acquire(exclude=tried)
+                tried.append(endpoint)
+                started = time.monotonic()
+                try:
+                    result = fn(endpoint.client)
+                except Exception as e:
+                    if not is_endpoint_error(e):
+                        # The request itself is at fault, another endpoint would fail the same way
+                        self.release(endpoint, success=None)
+                        raise
+                    if endpoint.limiter is not None:
+                        endpoint.limiter.record(started, classify_error(e), size)
+                    self.release(endpoint, success=False)
+                    last_error = e
+                    print(f"Request to {endpoint.name} failed: {str(e)}")
+                    continue
+                if endpoint.limiter is not None:
+                    endpoint.limiter.record(started, "ok", size)
+                self.release(endpoint, success=True)
+                return result
+        raise last_error
+
+    def stats(self):
+        """
+        Get per-endpoint counters
+
+        Returns:
+            list: One dict per endpoint
+        """
+        with self._cond:
+            now = time.monotonic()
+            return [
+                {
+                    "name": ep.name,
+                    "outstanding": ep.outstanding,
+                    "limit": ep.capacity(),
+                    "requests": ep.requests,
+                    "errors": ep.errors,
+                    "ejected": ep.is_ejected(now),
+                }
+                for ep in self.endpoints
+            ]
+
+
+if __name__ == "__main__":
+    # Test case: three stub endpoints, one of them failing
+    from concurrent.futures import ThreadPoolExecutor
+
+    class ServiceUnavailable(Exception):
+        status_code = 503
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    class StubClient:
+        def __init__(self, latency, fail):
+            self.latency = latency
+            self.fail = fail
+
+        def transcribe(self):
+            time.sleep(self.latency)
+            if self.fail:
+                raise ServiceUnavailable("503 Service Unavailable")
+            return "ok"
+
+    endpoints = [
+        Endpoint("http://hosted", "key", weight=2, max_concurrency=4),
+        Endpoint("http://self-hosted-1", "key", weight=1, max_concurrency=2),
+        Endpoint("http://self-hosted-2", "key", weight=1, max_concurrency=2),
+    ]
+    endpoints[0]._client = StubClient(0.02, fail=False)
+    endpoints[1]._client = StubClient(0.03, fail=False)
+    endpoints[2]._client = StubClient(0.01, fail=True)
+    router = EndpointRouter(endpoints, max_errors=2, cooldown=0.5)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: router.call(lambda client: client.transcribe()), range(200)))
+    print(f"{results.count('ok')}/{len(results)} succeeded in {time.monotonic() - started:.2f}s")
+    for stats in router.stats():
+        print(stats)
+
+    # A bad input fails once, without failover or ejecting any endpoint
+    def bad_input(client):
+        raise BadRequest("400 Invalid file format")
+
+    for _ in range(5):
+        try:
+            router.call(bad_input)
+        except BadRequest as e:
+            print(f"Raised at once: {e}")
+    print(f"Ejected: {[stats['name'] for stats in router.stats() if stats['ejected']]}")
+
+    # Test case: per-endpoint adaptive limits against stub providers that queue
+    # above 6 concurrent requests and throttle above 10
+    import contextlib
+    import io
+
+    class RateLimitError(Exception):
+        status_code = 429
+
+    class StubProvider:
+        def __init__(self, capacity=6, throttle_at=10, service_time=0.02):
+            self.capacity = capacity
+            self.throttle_at = throttle_at
+            self.service_time = service_time
+            self.active = 0
+            self.throttled = 0
+            self.lock = threading.Lock()
+
+        def transcribe(self):
+            with self.lock:
+                if self.active >= self.throttle_at:
+                    self.throttled += 1
+                    raise RateLimitError("429 Too Many Requests")
+                self.active += 1
+                load = self.active
+            try:
+                # Requests beyond capacity share the provider and slow down
+                time.sleep(self.service_time * max(1.0, load / self.capacity))
+            finally:
+                with self.lock:
+                    self.active -= 1
+            return "ok"
+
+    def run_stub(adaptive, requests=600, threads=32):
+        endpoints = []
+        for i in range(2):
+            limiter = AdaptiveLimiter(f"stub-{i}", initial=4, min_limit=1, max_limit=16) if adaptive else None
+            endpoint = Endpoint(f"http://stub-{i}", "key", max_concurrency=16, limiter=limiter)
+            endpoint._client = StubProvider()
+            endpoints.append(endpoint)
+        stub_router = EndpointRouter(endpoints, max_errors=1000, cooldown=0.5, retries=0)
+
+        def one(_):
+            try:
+                return stub_router.call(lambda client: client.transcribe())
+            except RateLimitError:
+                return "429"
+
+        started = time.monotonic()
+        # Failover messages are not printed
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(one, range(requests)))
+        throttled = sum(endpoint.client.throttled for endpoint in endpoints)
+        limits = [stats["limit"] for stats in stub_router.stats()]
+        print(f"{'Adaptive' if adaptive else 'Fixed max_concurrency 16'}: {results.count('ok')}/{requests} ok, "
+              f"{throttled} 429s from the providers, {time.monotonic() - started:.2f}s, limits {limits}")
+
+    run_stub(adaptive=False)
+    run_stub(adaptive=True)
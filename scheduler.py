@@ -0,0 +1,242 @@
+"""
+Duration-aware batch scheduling
+
+Turn a batch of audio files into schedulable work units, order them by a
+policy and predict their completion on a pool of workers. Files that will
+need splitting become one unit per segment, so a long file no longer holds
+up the batch.
+
+Policies:
+    lpt: Longest processing time first, minimises the makespan
+    spt: Shortest processing time first, minimises the mean completion time
+"""
+
+import heapq
+
+POLICIES = ("lpt", "spt")
+
+
+class WorkUnit:
+    """
+    One schedulable unit of work
+
+    kind is one of:
+        direct: The file is small enough to upload as is
+        convert: The file is converted to MP3 first, then uploaded
+        segment: A slice of the file is cut, converted and uploaded
+
+    stream_copy marks a segment that is cut without re-encoding, used for
+    files small enough to upload as is.
+    """
+
+    def __init__(self, file_index, file_path, kind, index=0, count=1,
+                 start_ms=0, duration_ms=0, stream_copy=False):
+        self.file_index = file_index
+        self.file_path = file_path
+        self.kind = kind
+        self.index = index
+        self.count = count
+        self.start_ms = start_ms
+        self.duration_ms = duration_ms
+        self.stream_copy = stream_copy
+
+    def __repr__(self):
+        return (f"WorkUnit({self.file_path!r}, {self.kind}, "
+                f"{self.index + 1}/{self.count}, {self.duration_ms}ms)")
+
+
+def parse_bitrate(bitrate):
+    """
+    Parse an ffmpeg bitrate string
+
+    Args:
+        bitrate: Bitrate such as "96k" or "1M"
+
+    Returns:
+        int: Bitrate in bits per second
+    """
+    bitrate = str(bitrate).strip().lower()
+    multipliers = {"k": 1000, "m": 1000 * 1000}
+    if bitrate and bitrate[-1] in multipliers:
+        return int(float(bitrate[:-1]) * multipliers[bitrate[-1]])
+    return int(bitrate)
+
+
+def segment_bounds(duration_ms, split_interval, first_chunk=None, growth=2.0):
+    """
+    Compute segment boundaries
+
+    By default every segment is split_interval long. With first_chunk set,
+    the first segment is first_chunk long and the rest of the audio is packed
+    into as few segments of at most split_interval as it needs, so the first
+    text arrives early at the cost of a single extra request. Where that
+    leaves slack, segments grow by growth from the first chunk so the next
+    text also arrives early.
+
+    Args:
+        duration_ms: Audio duration in milliseconds
+        split_interval: Longest segment in milliseconds
+        first_chunk: Length of the first segment in milliseconds
+        growth: Growth factor between consecutive segments
+
+    Returns:
+        list: (start_ms, length_ms) tuples
+    """
+    if not first_chunk:
+        bounds = [(start, min(split_interval, duration_ms - start))
+                  for start in range(0, duration_ms, split_interval)]
+        return bounds or [(0, duration_ms)]
+
+    length = min(first_chunk, split_interval, duration_ms)
+    bounds = [(0, length)]
+    start = length
+    count = -(-(duration_ms - start) // split_interval)  # Fewest segments for the rest
+    while start < duration_ms:
+        remaining = duration_ms - start
+        # Grow from the previous segment, but never so little that the rest needs another segment
+        length = min(max(int(length * growth), remaining - (count - 1) * split_interval),
+                     split_interval, remaining)
+        bounds.append((start, length))
+        start += length
+        count -= 1
+    return bounds
+
+
+def plan_file_units(file_index, file_path, duration, file_size, audio_config, progressive_config=None):
+    """
+    Decide how a file is processed, mirroring the size checks of transcribe_audio
+
+    Files over max_file_size are converted to MP3 at mp3_bitrate. When the
+    converted size is predicted to still exceed max_file_size, the file is
+    planned as split_interval segments instead. In progressive mode every
+    file longer than the first chunk is split into a short first chunk and
+    as few segments as the rest needs; a file small enough to upload as is
+    is cut without re-encoding into just the first chunk and the rest.
+
+    Args:
+        file_index: Index of the file in the batch
+        file_path: Audio file path
+        duration: Duration in seconds
+        file_size: File size in bytes
+        audio_config: Audio configuration dict
+        progressive_config: Progressive chunking configuration dict
+
+    Returns:
+        list: WorkUnit list for the file
+    """
+    duration_ms = int(duration * 1000)
+    interval = audio_config["split_interval"]
+    if progressive_config and progressive_config["enabled"] and duration_ms > progressive_config["first_chunk"]:
+        stream_copy = file_size <= audio_config["max_file_size"]
+        if stream_copy:
+            # Slices of a file that fits in one upload fit as well
+            first_chunk = progressive_config["first_chunk"]
+            bounds = [(0, first_chunk), (first_chunk, duration_ms - first_chunk)]
+        else:
+            bounds = segment_bounds(duration_ms, interval, progressive_config["first_chunk"], progressive_config["growth"])
+        return [
+            WorkUnit(file_index, file_path, "segment", index=i, count=len(bounds),
+                     start_ms=start_ms, duration_ms=length_ms, stream_copy=stream_copy)
+            for i, (start_ms, length_ms) in enumerate(bounds)
+        ]
+
+    if file_size <= audio_config["max_file_size"]:
+        return [WorkUnit(file_index, file_path, "direct", duration_ms=duration_ms)]
+
+    converted_size = duration * parse_bitrate(audio_config["mp3_bitrate"]) / 8
+    if converted_size <= audio_config["max_file_size"]:
+        return [WorkUnit(file_index, file_path, "convert", duration_ms=duration_ms)]
+
+    bounds = segment_bounds(duration_ms, interval)
+    return [
+        WorkUnit(file_index, file_path, "segment", index=i, count=len(bounds),
+                 start_ms=start_ms, duration_ms=length_ms)
+        for i, (start_ms, length_ms) in enumerate(bounds)
+    ]
+
+
+def estimate_seconds(unit, schedule_config):
+    """
+    Estimate how long a unit takes to process
+
+    Args:
+        unit: WorkUnit
+        schedule_config: Dict with realtime_factor and request_overhead
+
+    Returns:
+        float: Estimated processing time in seconds
+    """
+    return (schedule_config["request_overhead"]
+            + unit.duration_ms / 1000 * schedule_config["realtime_factor"])
+
+
+def order_units(units, policy, schedule_config, in_file_order=False):
+    """
+    Order units for list scheduling
+
+    Args:
+        units: WorkUnit list
+        policy: "lpt" or "spt"
+        schedule_config: Schedule configuration dict
+        in_file_order: Start every file's first segment before any second
+            segment and so on, so each file's text arrives in order
+
+    Returns:
+        list: Units in the order they should be started
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy: {policy}")
+    ordered = sorted(units,
+                     key=lambda unit: estimate_seconds(unit, schedule_config),
+                     reverse=(policy == "lpt"))
+    if in_file_order:
+        ordered.sort(key=lambda unit: unit.index)
+    return ordered
+
+
+def simulate(units, workers, schedule_config):
+    """
+    Predict completion times when units run in order on a pool of workers
+
+    Args:
+        units: Ordered WorkUnit list
+        workers: Number of workers
+        schedule_config: Schedule configuration dict
+
+    Returns:
+        dict: makespan, mean_completion and per-file completion times in seconds
+    """
+    free_at = [0.0] * max(1, workers)
+    file_completion = {}
+    for unit in units:
+        start = heapq.heappop(free_at)
+        finish = start + estimate_seconds(unit, schedule_config)
+        heapq.heappush(free_at, finish)
+        file_completion[unit.file_path] = max(file_completion.get(unit.file_path, 0.0), finish)
+
+    completions = list(file_completion.values())
+    return {
+        "makespan": max(completions, default=0.0),
+        "mean_completion": sum(completions) / len(completions) if completions else 0.0,
+        "file_completion": file_completion,
+    }
+
+
+if __name__ == "__main__":
+    # Test case: one 8-hour file among short ones
+    from config import AUDIO_CONFIG, SCHEDULE_CONFIG
+
+    durations = [600] * 12 + [8 * 3600]
+    units = []
+    for file_index, duration in enumerate(durations):
+        file_size = duration * 128000 / 8
+        units += plan_file_units(file_index, f"file_{file_index}.mp3", duration, file_size, AUDIO_CONFIG)
+
+    print(f"{len(durations)} files, {len(units)} units, {SCHEDULE_CONFIG['workers']} workers")
+    for policy in POLICIES:
+        prediction = simulate(order_units(units, policy, SCHEDULE_CONFIG), SCHEDULE_CONFIG["workers"], SCHEDULE_CONFIG)
+        print(f"{policy}: makespan {prediction['makespan']:.0f}s, "
+              f"mean completion {prediction['mean_completion']:.0f}s")
+    prediction = simulate(units, SCHEDULE_CONFIG["workers"], SCHEDULE_CONFIG)
+    print(f"path order: makespan {prediction['makespan']:.0f}s, "
+          f"mean completion {prediction['mean_completion']:.0f}s")
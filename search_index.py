@@ -0,0 +1,289 @@
+"""
+Full-text search over transcripts
+
+Keep a SQLite index of transcript cues (text, start/end in milliseconds and
+source files). Cues are stored in a plain table indexed by transcript, with
+an external-content FTS5 table over their text, so re-indexing one transcript
+only touches its own cues. transcribe_audio updates the index as each
+transcript is written, so a finished file is searchable immediately.
+
+Queries match every word by default; --raw passes FTS5 syntax through.
+
+Usage:
+    python search_index.py "exchange rate" [--limit 20] [--phrase]
+    python search_index.py 'NEAR(exchange rate) OR fx*' --raw
+    python search_index.py --reindex
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from config import OUTPUT_CONFIG, INDEX_CONFIG
+
+TIMESTAMP = r'(\d{2}):(\d{2}):(\d{2})[,.](\d{3})'
+CUE_PATTERN = re.compile(TIMESTAMP + r' --> ' + TIMESTAMP + r'[^\n]*\n(.*?)(?:\n\s*\n|\Z)', re.S)
+SEGMENT_MARKER = re.compile(r'=== .+ ===')
+
+FORMATS = {
+    ".srt": "srt",
+    ".vtt": "vtt",
+    ".json": "json",
+    ".txt": "text",
+}
+
+
+def connect(db_path=None):
+    """
+    Open the index, creating it if needed
+
+    Args:
+        db_path: Database path, defaults to INDEX_CONFIG["db_path"]
+
+    Returns:
+        sqlite3.Connection: Open connection
+    """
+    db_path = db_path or INDEX_CONFIG["db_path"]
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cue_rows (
+            id INTEGER PRIMARY KEY,
+            transcript TEXT,
+            audio TEXT,
+            start_ms INTEGER,
+            end_ms INTEGER,
+            text TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS cue_rows_transcript ON cue_rows (transcript)")
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cues USING fts5(text, content='cue_rows', content_rowid='id')")
+    # Keep the full-text index in step with cue_rows
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS cue_rows_insert AFTER INSERT ON cue_rows BEGIN
+            INSERT INTO cues (rowid, text) VALUES (new.id, new.text);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS cue_rows_delete AFTER DELETE ON cue_rows BEGIN
+            INSERT INTO cues (cues, rowid, text) VALUES ('delete', old.id, old.text);
+        END
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transcripts (
+            transcript TEXT PRIMARY KEY,
+            audio TEXT,
+            cues INTEGER,
+            indexed_at REAL
+        )
+    """)
+    return conn
+
+
+def _to_ms(h, m, s, ms):
+    return int(h) * 3600000 + int(m) * 60000 + int(s) * 1000 + int(ms)
+
+
+def parse_cues(content, response_format):
+    """
+    Split transcript content into cues
+
+    Args:
+        content: Transcript content
+        response_format: Whisper API response format of the content
+
+    Returns:
+        list: (start_ms, end_ms, text) tuples, times are None when the format has none
+    """
+    if response_format in ["srt", "vtt"]:
+        cues = []
+        for match in CUE_PATTERN.finditer(content):
+            text = " ".join(line.strip() for line in match.group(9).splitlines() if line.strip())
+            if text:
+                cues.append((_to_ms(*match.groups()[0:4]), _to_ms(*match.groups()[4:8]), text))
+        return cues
+
+    if response_format in ["json", "verbose_json"]:
+        cues = []
+        # Merged files may hold several JSON documents separated by newlines
+        decoder = json.JSONDecoder()
+        position = 0
+        content = content.strip()
+        while position < len(content):
+            try:
+                document, position = decoder.raw_decode(content, position)
+            except ValueError:
+                break
+            while position < len(content) and content[position].isspace():
+                position += 1
+            if document.get("segments"):
+                cues += [
+                    (int(segment["start"] * 1000), int(segment["end"] * 1000), segment["text"].strip())
+                    for segment in document["segments"]
+                ]
+            elif document.get("text"):
+                cues.append((None, None, document["text"].strip()))
+        return cues
+
+    # Plain text: one cue per paragraph without times, skipping segment markers
+    return [
+        (None, None, paragraph.strip())
+        for paragraph in re.split(r'\n\s*\n', content)
+        if paragraph.strip() and not SEGMENT_MARKER.fullmatch(paragraph.strip())
+    ]
+
+
+def index_transcript(transcript_path, content, response_format, audio_path=None, db_path=None):
+    """
+    Replace the cues of one transcript in the index
+
+    Args:
+        transcript_path: Transcript file path
+        content: Transcript content
+        response_format: Whisper API response format of the content
+        audio_path: Source audio file path
+        db_path: Database path, defaults to INDEX_CONFIG["db_path"]
+
+    Returns:
+        int: Number of cues indexed
+    """
+    cues = parse_cues(content, response_format)
+    conn = connect(db_path)
+    try:
+        with conn:
+            if audio_path is None:
+                # Keep the source audio recorded when the transcript was first indexed
+                row = conn.execute("SELECT audio FROM transcripts WHERE transcript = ?", (transcript_path,)).fetchone()
+                audio_path = row[0] if row else None
+            conn.execute("DELETE FROM cue_rows WHERE transcript = ?", (transcript_path,))
+            conn.executemany(
+                "INSERT INTO cue_rows (text, transcript, audio, start_ms, end_ms) VALUES (?, ?, ?, ?, ?)",
+                [(text, transcript_path, audio_path, start_ms, end_ms) for start_ms, end_ms, text in cues]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts (transcript, audio, cues, indexed_at) VALUES (?, ?, ?, ?)",
+                (transcript_path, audio_path, len(cues), time.time())
+            )
+    finally:
+        conn.close()
+    return len(cues)
+
+
+def reindex(transcripts_dir=None, db_path=None):
+    """
+    Index every transcript file in a directory
+
+    Args:
+        transcripts_dir: Directory to scan, defaults to OUTPUT_CONFIG["transcripts_dir"]
+        db_path: Database path, defaults to INDEX_CONFIG["db_path"]
+
+    Returns:
+        int: Number of transcript files indexed
+    """
+    transcripts_dir = transcripts_dir or OUTPUT_CONFIG["transcripts_dir"]
+    count = 0
+    for root, _, files in os.walk(transcripts_dir):
+        for file in sorted(files):
+            response_format = FORMATS.get(os.path.splitext(file)[1].lower())
+            if response_format is None:
+                continue
+            path = os.path.join(root, file)
+            with open(path, "r", encoding="utf-8") as f:
+                index_transcript(path, f.read(), response_format, db_path=db_path)
+            count += 1
+    return count
+
+
+def _quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def build_query(query, phrase=False):
+    """
+    Turn plain text into an FTS5 query
+
+    Every word is quoted, so punctuation such as "can't" or "exchange-rate"
+    is matched as text instead of being read as FTS5 syntax.
+
+    Args:
+        query: Words to search for
+        phrase: Match the words as one exact phrase instead of each word anywhere in a cue
+
+    Returns:
+        str: FTS5 query
+    """
+    if phrase:
+        return _quote(query)
+    return " ".join(_quote(term) for term in query.split())
+
+
+def search(query, limit=20, phrase=False, raw=False, db_path=None):
+    """
+    Find cues matching a query
+
+    Args:
+        query: Words to search for, or an FTS5 query with raw, e.g. 'NEAR(exchange rate)'
+        limit: Maximum number of results
+        phrase: Match the query as an exact phrase
+        raw: Pass the query to FTS5 unchanged
+        db_path: Database path, defaults to INDEX_CONFIG["db_path"]
+
+    Returns:
+        list: Dicts with transcript, audio, start_ms, end_ms and text, best match first
+
+    Raises:
+        sqlite3.OperationalError: If a raw query is not valid FTS5 syntax
+    """
+    if not raw:
+        query = build_query(query, phrase)
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT cue_rows.transcript, cue_rows.audio, cue_rows.start_ms, cue_rows.end_ms, cue_rows.text "
+            "FROM cues JOIN cue_rows ON cue_rows.id = cues.rowid "
+            "WHERE cues MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {"transcript": transcript, "audio": audio, "start_ms": start_ms, "end_ms": end_ms, "text": text}
+        for transcript, audio, start_ms, end_ms, text in rows
+    ]
+
+
+def format_ms(ms):
+    """Format milliseconds as HH:MM:SS.mmm, or "-" when unknown"""
+    if ms is None:
+        return "-"
+    return f"{ms // 3600000:02d}:{ms % 3600000 // 60000:02d}:{ms % 60000 // 1000:02d}.{ms % 1000:03d}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search transcripts")
+    parser.add_argument("query", nargs="?", help="Words to search for")
+    parser.add_argument("--limit", type=int, default=20, help="Maximum number of results")
+    parser.add_argument("--phrase", action="store_true", help="Match the query as an exact phrase")
+    parser.add_argument("--raw", action="store_true", help="Pass the query to FTS5 unchanged (AND, OR, NEAR, prefix*)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--reindex", action="store_true", help="Index every file in the transcripts directory")
+    parser.add_argument("--db", help="Database path, defaults to INDEX_CONFIG['db_path']")
+    args = parser.parse_args()
+
+    if args.reindex:
+        print(f"Indexed {reindex(db_path=args.db)} transcripts")
+    if args.query:
+        try:
+            results = search(args.query, limit=args.limit, phrase=args.phrase, raw=args.raw, db_path=args.db)
+        except sqlite3.OperationalError as e:
+            raise SystemExit(f"Invalid search query {args.query!r}: {e}")
+        if args.json:
+            print(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            for result in results:
+                print(f"{result['transcript']} [{format_ms(result['start_ms'])} --> {format_ms(result['end_ms'])}] "
+                      f"{result['text']}")
+    elif not args.reindex:
+        parser.print_help()
@@ -0,0 +1,264 @@
+"""
+Live stream transcription
+
+Read an ongoing recording (an ffmpeg-readable URL, a growing file or stdin)
+continuously through ffmpeg, cut rolling windows at silences, transcribe
+each window as soon as it closes and append the offset-corrected cues to a
+live SRT/VTT/text output. Windows are bounded in length and only a bounded
+number of them are in flight, so memory and lag stay bounded.
+
+Usage:
+    python stream_transcriber.py rtmp://host/live/stream -o live.srt
+    python stream_transcriber.py recording.m4a --follow -o live.srt
+    ffmpeg -re -i talk.mp3 -f wav - | python stream_transcriber.py - -o live.srt
+"""
+
+import argparse
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from config import STREAM_CONFIG
+from job_config import default_job
+from preprocess import audioop, SAMPLE_RATE, SAMPLE_WIDTH, BYTES_PER_MS, FRAME_MS, FRAME_BYTES
+from text_processor import process_text
+from whisper_sample import create_transcription, adjust_timestamps, needs_timestamp_adjustment, get_output_extension
+
+CUE_NUMBER = re.compile(r'(?m)^\d+[ \t]*\n(?=\d{2}:\d{2}:\d{2}[,.]\d{3} --> )')
+
+
+class StreamTranscriber:
+    """Cut a live PCM stream into windows at silences and transcribe them in order"""
+
+    def __init__(self, output_path, stream_config, on_text=None, job=None):
+        """
+        Args:
+            output_path: Live output file, appended as windows are transcribed
+            stream_config: Dict with min_window, max_window, min_silence,
+                silence_threshold, workers and max_pending
+            on_text: Optional callback called as on_text(start_ms, end_ms, content)
+            job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+        """
+        self.output_path = output_path
+        self.config = stream_config
+        self.on_text = on_text
+        self.job = job or default_job()
+        self.response_format = self.job.audio["response_format"]
+        self.threshold_rms = 32768 * 10 ** (stream_config["silence_threshold"] / 20)
+        self.cue_count = 0
+        self.started_at = None
+
+    def windows(self, reader):
+        """
+        Split 16kHz mono s16le PCM into windows ending in silence
+
+        A window closes once it is at least min_window long and a silence of
+        min_silence is reached, cutting in the middle of that silence. A window
+        reaching max_window is cut at its quietest frame in the last 2 seconds.
+
+        Args:
+            reader: Binary file object with PCM input
+
+        Yields:
+            tuple: (start_ms, pcm bytes, whether the window contains speech)
+        """
+        min_frames = self.config["min_window"] // FRAME_MS
+        max_frames = self.config["max_window"] // FRAME_MS
+        silence_frames = self.config["min_silence"] // FRAME_MS
+        search_frames = min(2000 // FRAME_MS, max_frames)
+
+        frames = []   # (pcm, rms) of the open window
+        start_ms = 0
+        silent_run = 0
+
+        def close(cut):
+            nonlocal frames, start_ms
+            window = frames[:cut]
+            frames = frames[cut:]
+            pcm = b"".join(frame for frame, _ in window)
+            voiced = any(rms >= self.threshold_rms for _, rms in window)
+            result = (start_ms, pcm, voiced)
+            start_ms += len(pcm) // BYTES_PER_MS
+            return result
+
+        while True:
+            frame = reader.read(FRAME_BYTES)
+            if len(frame) < BYTES_PER_MS:
+                break
+            frame = frame[:len(frame) - len(frame) % BYTES_PER_MS]
+            rms = audioop.rms(frame, SAMPLE_WIDTH)
+            frames.append((frame, rms))
+            silent_run = silent_run + 1 if rms < self.threshold_rms else 0
+
+            if len(frames) >= min_frames and silent_run >= silence_frames:
+                # Cut in the middle of the silence
+                yield close(len(frames) - silent_run // 2)
+                silent_run = len(frames)
+            elif len(frames) >= max_frames:
+                # No silence in time: cut at the quietest recent frame
+                recent = range(len(frames) - search_frames, len(frames))
+                yield close(min(recent, key=lambda i: frames[i][1]) + 1)
+                silent_run = 0
+
+        if frames:
+            yield close(len(frames))
+
+    def transcribe_window(self, index, pcm):
+        """
+        Transcribe one window
+
+        Args:
+            index: Window index, used for the temporary file name
+            pcm: Window PCM
+
+        Returns:
+            str: Transcription relative to the window start
+        """
+        os.makedirs(self.job.output["audio_chunks_dir"], exist_ok=True)
+        wav_path = os.path.join(self.job.output["audio_chunks_dir"], f"stream_{index}.wav")
+        with wave.open(wav_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(SAMPLE_WIDTH)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(pcm)
+        try:
+            transcription = create_transcription(wav_path, self.job)
+        finally:
+            os.remove(wav_path)
+
+        # Same AI text processing as file transcription
+        if self.response_format == "text":
+            transcription = process_text(transcription, self.job)
+        return transcription
+
+    def format_window(self, transcription, start_ms):
+        """
+        Shift a window's cues to stream time and continue the cue numbering
+
+        Args:
+            transcription: Transcription relative to the window start
+            start_ms: Window start in the stream
+
+        Returns:
+            str: Content to append to the live output
+        """
+        if not needs_timestamp_adjustment(self.response_format):
+            return transcription.strip() + "\n"
+
+        content = adjust_timestamps(transcription, start_ms, self.job)
+        # The WEBVTT header is written once at the top of the output
+        content = re.sub(r'^\s*WEBVTT[^\n]*\n', '', content)
+
+        def renumber(match):
+            self.cue_count += 1
+            return f"{self.cue_count}\n"
+
+        return CUE_NUMBER.sub(renumber, content).strip() + "\n\n"
+
+    def write_loop(self, pending, output):
+        """Write windows to the output in order as their transcriptions finish"""
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            start_ms, end_ms, future = item
+            try:
+                transcription = future.result()
+            except Exception as e:
+                print(f"Failed to transcribe {start_ms}-{end_ms}ms: {str(e)}")
+                continue
+            # A failing format or on_text callback must not stop the writer, or the
+            # reader would block forever on the bounded queue
+            try:
+                self.write_window(output, start_ms, end_ms, transcription)
+            except Exception as e:
+                print(f"Failed to write {start_ms}-{end_ms}ms: {str(e)}")
+
+    def write_window(self, output, start_ms, end_ms, transcription):
+        """Append one window's transcription to the output and report it"""
+        if transcription is None:
+            return
+
+        content = self.format_window(transcription, start_ms)
+        output.write(content)
+        output.flush()
+        # How long after the window's audio arrived (for a real-time source) its text was written
+        lag = max(0.0, time.monotonic() - self.started_at - end_ms / 1000)
+        print(f"Transcribed {start_ms/1000:.1f}-{end_ms/1000:.1f}s, lag {lag:.1f}s")
+        if self.on_text is not None:
+            self.on_text(start_ms, end_ms, content)
+
+    def run(self, source, follow=False, realtime=False):
+        """
+        Transcribe a stream until it ends
+
+        Args:
+            source: Anything ffmpeg can read, or "-" for stdin
+            follow: Keep reading a file that is still being written
+            realtime: Read the input at its native rate (for testing with local files)
+        """
+        cmd = ["ffmpeg", "-v", "error"]
+        if realtime:
+            cmd += ["-re"]
+        if follow:
+            cmd += ["-follow", "1"]
+        cmd += [
+            "-i", "pipe:0" if source == "-" else source,
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "-"
+        ]
+        decoder = subprocess.Popen(
+            cmd,
+            stdin=sys.stdin.buffer if source == "-" else subprocess.DEVNULL,
+            stdout=subprocess.PIPE
+        )
+
+        # Bounded queue: reading blocks when max_pending windows are in flight
+        pending = queue.Queue(maxsize=self.config["max_pending"])
+        pool = ThreadPoolExecutor(max_workers=self.config["workers"])
+        with open(self.output_path, "w", encoding="utf-8") as output:
+            if self.response_format == "vtt":
+                output.write("WEBVTT\n\n")
+                output.flush()
+            writer = threading.Thread(target=self.write_loop, args=(pending, output))
+            writer.start()
+            self.started_at = time.monotonic()
+            try:
+                for index, (start_ms, pcm, voiced) in enumerate(self.windows(decoder.stdout)):
+                    end_ms = start_ms + len(pcm) // BYTES_PER_MS
+                    if not voiced:
+                        # Nothing to transcribe, skip the call
+                        continue
+                    pending.put((start_ms, end_ms, pool.submit(self.transcribe_window, index, pcm)))
+            finally:
+                pending.put(None)
+                writer.join()
+                pool.shutdown()
+                decoder.stdout.close()
+                decoder.wait()
+                # A job built with JobConfig.create has a temporary directory of its own
+                if self.job.run_id is not None and os.path.isdir(self.job.output["audio_chunks_dir"]):
+                    try:
+                        os.rmdir(self.job.output["audio_chunks_dir"])
+                    except OSError:
+                        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe a live stream, growing file or stdin")
+    parser.add_argument("source", help="Stream URL, file path, or - for stdin")
+    parser.add_argument("-o", "--output", help="Live output file, defaults to transcripts/live<extension>")
+    parser.add_argument("--follow", action="store_true", help="Keep reading a file that is still being written")
+    parser.add_argument("--realtime", action="store_true", help="Read the input at its native rate")
+    args = parser.parse_args()
+
+    job = default_job()
+    output_path = args.output or os.path.join(job.output["transcripts_dir"], f"live{get_output_extension(job)}")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    StreamTranscriber(output_path, STREAM_CONFIG, job=job).run(args.source, follow=args.follow, realtime=args.realtime)
+    print(f"Stream ended, transcript saved to: {output_path}")
@@ -1,28 +1,54 @@
+import time
 from openai import OpenAI
-from config import AI_CONFIG
+from config import ADAPTIVE_CONFIG
+from concurrency import AdaptiveLimiter, classify_error
+from job_config import default_job
 
-def process_text(text_content):
+# Adaptive limit on in-flight chat requests (optional)
+chat_limiter = None
+if ADAPTIVE_CONFIG["enabled"]:
+    chat_limiter = AdaptiveLimiter.from_config("chat", ADAPTIVE_CONFIG["chat"], ADAPTIVE_CONFIG)
+
+def process_text(text_content, job=None):
     """
     Use AI to process text content
     
     Args:
         text_content: Transcribed text content
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
     
     Returns:
         str: AI processed text
     """
+    ai_config = (job or default_job()).ai
     try:
         client = OpenAI(
-            base_url=AI_CONFIG["base_url"],
-            api_key=AI_CONFIG["api_key"]
+            base_url=ai_config["base_url"],
+            api_key=ai_config["api_key"],
+            # With the adaptive limiter, retry below so every 429 reaches it
+            max_retries=2 if chat_limiter is None else 0
         )
         
-        response = client.chat.completions.create(
-            model=AI_CONFIG["model"],
-            messages=[
-                {"role": "user", "content": AI_CONFIG["system_prompt"] + text_content},
-            ]
-        )
+        def send():
+            return client.chat.completions.create(
+                model=ai_config["model"],
+                messages=[
+                    {"role": "user", "content": ai_config["system_prompt"] + text_content},
+                ]
+            )
+        
+        if chat_limiter is None:
+            response = send()
+        else:
+            # Latency is compared per 1000 characters of input
+            for attempt in range(3):
+                try:
+                    response = chat_limiter.call(send, size=max(1, len(text_content)) / 1000)
+                    break
+                except Exception as e:
+                    if attempt == 2 or classify_error(e) not in ("throttled", "timeout"):
+                        raise
+                    time.sleep(2 ** attempt)
         
         return response.choices[0].message.content
         
@@ -18,16 +18,36 @@ from openai import OpenAI
 from pydub import AudioSegment
 import os
 import re
-from config import OPENAI_CONFIG, AUDIO_CONFIG, OUTPUT_CONFIG
-from text_processor import process_text
+from config import OPENAI_CONFIG, OPENAI_ENDPOINTS, ROUTER_CONFIG, HEDGE_CONFIG, ADAPTIVE_CONFIG, SCHEDULE_CONFIG, PIPELINE_CONFIG, PREPROCESS_CONFIG, INDEX_CONFIG, PROGRESSIVE_CONFIG
+from text_processor import process_text, chat_limiter
+from hedging import HedgedCaller, AttemptCancelled
+from router import EndpointRouter
+from job_config import default_job
+from scheduler import plan_file_units, order_units, simulate, parse_bitrate
+from pipeline import Stage, run_pipeline
+from preprocess import preprocess_audio, remap_timestamps
+from search_index import index_transcript
 import subprocess
+import threading
 import time
 
-# 初始化OpenAI客户端
-client = OpenAI(
-    base_url=OPENAI_CONFIG["base_url"],
-    api_key=OPENAI_CONFIG["api_key"]
-)
+# 初始化Whisper API端点路由
+router = EndpointRouter.from_config(OPENAI_ENDPOINTS, ROUTER_CONFIG, ADAPTIVE_CONFIG)
+
+# 任务配置指定了其他端点时使用的路由，按 (base_url, api_key) 缓存
+job_routers = {}
+job_routers_lock = threading.Lock()
+
+# 初始化对冲请求（可选）
+hedger = None
+if HEDGE_CONFIG["enabled"]:
+    hedger = HedgedCaller(
+        percentile=HEDGE_CONFIG["percentile"],
+        window=HEDGE_CONFIG["window"],
+        min_samples=HEDGE_CONFIG["min_samples"],
+        min_delay=HEDGE_CONFIG["min_delay"],
+        max_extra_ratio=HEDGE_CONFIG["max_extra_ratio"]
+    )
 
 def get_audio_format(file_path):
     """
@@ -71,17 +91,19 @@ def load_audio(file_path):
         except:
             raise ValueError(f"不支持的音频格式或缺少解码器: {audio_format}")
 
-def get_audio_info(audio_file_path):
+def get_audio_info(audio_file_path, verbose=True):
     """
     获取音频文件的时长和比特率
     
     Args:
         audio_file_path: 音频文件路径
+        verbose: 是否打印进度信息
     
     Returns:
         tuple: (duration, bitrate)，分别为时长（秒）和比特率（bps）
     """
-    print("正在获取音频信息...")
+    if verbose:
+        print("正在获取音频信息...")
     probe_cmd = [
         "ffprobe",
         "-v", "error",
@@ -99,30 +121,34 @@ def get_audio_info(audio_file_path):
         file_size = os.path.getsize(audio_file_path)
         bitrate = int((file_size * 8) / duration)  # 估算比特率
     
-    print(f"音频总时长: {duration:.2f}秒")
-    print(f"音频比特率: {bitrate/1000:.0f}kbps")
+    if verbose:
+        print(f"音频总时长: {duration:.2f}秒")
+        print(f"音频比特率: {bitrate/1000:.0f}kbps")
     return duration, bitrate
 
-def split_audio(audio_file_path):
+def split_audio(audio_file_path, prefix="segment", job=None):
     """
     使用ffmpeg无损分割音频文件
     
     Args:
         audio_file_path: 音频文件路径
+        prefix: 分段文件名前缀，用于区分同时处理的多个文件
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
     
     Returns:
         list: 分割后的音频文件路径列表
     """
+    job = job or default_job()
     print("\n=== 开始音频分割 ===")
     # 确保输出目录存在
-    os.makedirs(OUTPUT_CONFIG["audio_chunks_dir"], exist_ok=True)
-    os.makedirs(OUTPUT_CONFIG["trans_chunks_dir"], exist_ok=True)
+    os.makedirs(job.output["audio_chunks_dir"], exist_ok=True)
+    os.makedirs(job.output["trans_chunks_dir"], exist_ok=True)
     
     # 获取音频时长
     duration, _ = get_audio_info(audio_file_path)
     
     # 计算需要分割的段数
-    segment_duration = AUDIO_CONFIG["split_interval"] / 1000  # 转换为秒
+    segment_duration = job.audio["split_interval"] / 1000  # 转换为秒
     total_segments = (int(duration) + int(segment_duration) - 1) // int(segment_duration)
     segments = []
     
@@ -131,7 +157,7 @@ def split_audio(audio_file_path):
     print(f"预计分割为{total_segments}段")
     
     for i in range(0, int(duration), int(segment_duration)):
-        segment_path = f"{OUTPUT_CONFIG['audio_chunks_dir']}/segment_{i//int(segment_duration)}.mp3"
+        segment_path = f"{job.output['audio_chunks_dir']}/{prefix}_{i//int(segment_duration)}.mp3"
         
         # 构建ffmpeg命令
         cmd = [
@@ -155,12 +181,56 @@ def split_audio(audio_file_path):
     print("=== 音频分割完成 ===\n")
     return segments
 
+def cut_segment(audio_file_path, start_ms, duration_ms, segment_path, job=None, stream_copy=False):
+    """
+    使用ffmpeg截取一段音频并转换为指定码率的单声道MP3
+    
+    用于把大文件的各个分段作为独立的调度单元处理，省去整体转换再分割的步骤
+    
+    Args:
+        audio_file_path: 音频文件路径
+        start_ms: 开始时间（毫秒）
+        duration_ms: 持续时间（毫秒）
+        segment_path: 输出文件路径
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+        stream_copy: 是否直接复制音频流而不重新编码，输出格式需与输入相同
+    
+    Returns:
+        str: 截取后的音频文件路径
+    
+    Raises:
+        RuntimeError: ffmpeg截取失败时抛出
+    """
+    job = job or default_job()
+    cmd = [
+        "ffmpeg",
+        "-ss", str(start_ms / 1000),     # 开始时间点，放在输入文件前以快速定位
+        "-t", str(duration_ms / 1000),   # 持续时间
+        "-i", audio_file_path,           # 输入文件
+    ]
+    if stream_copy:
+        cmd += ["-vn", "-c:a", "copy"]   # 复制音频流，不重新编码
+    else:
+        cmd += [
+            "-b:a", job.audio["mp3_bitrate"],  # 设置音频比特率
+            "-ac", "1",                  # 转换为单声道
+        ]
+    cmd += [
+        "-y",                            # 自动覆盖已存在文件
+        segment_path                     # 输出文件路径
+    ]
+    
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"音频截取失败: {segment_path}")
+    return segment_path
+
 def add_time(time_str, offset_ms):
     """
     为时间字符串添加偏移量
     
     Args:
-        time_str: 时间字符串，格式为 "HH:MM:SS,mmm"
+        time_str: 时间字符串，格式为 "HH:MM:SS,mmm"（SRT）或 "HH:MM:SS.mmm"（VTT）
         offset_ms: 要添加的时间偏移量（毫秒）
     
     Returns:
@@ -168,7 +238,8 @@ def add_time(time_str, offset_ms):
     """
     # 将时间字符串转换为毫秒
     h, m, s = time_str.split(':')
-    s, ms = s.split(',')
+    separator = ',' if ',' in s else '.'  # SRT使用逗号，VTT使用点号
+    s, ms = s.split(separator)
     total_ms = int(h) * 3600000 + int(m) * 60000 + int(s) * 1000 + int(ms)
     # 添加偏移
     total_ms += offset_ms
@@ -177,15 +248,16 @@ def add_time(time_str, offset_ms):
     m = (total_ms % 3600000) // 60000
     s = (total_ms % 60000) // 1000
     ms = total_ms % 1000
-    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+    return f"{h:02d}:{m:02d}:{s:02d}{separator}{ms:03d}"
 
-def adjust_timestamps(content, time_offset):
+def adjust_timestamps(content, time_offset, job=None):
     """
     调整字幕文件的时间戳
     
     Args:
         content: 字幕文件内容
         time_offset: 时间偏移量（毫秒）
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
     
     Returns:
         str: 调整后的字幕内容
@@ -193,11 +265,12 @@ def adjust_timestamps(content, time_offset):
     Note:
         目前支持 SRT 和 VTT 格式的时间戳调整
     """
-    if AUDIO_CONFIG["response_format"] not in ["srt", "vtt"]:
+    job = job or default_job()
+    if job.audio["response_format"] not in ["srt", "vtt"]:
         return content
         
     # 使用正则表达式匹配时间戳行
-    pattern = r'(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})'
+    pattern = r'(\d{2}:\d{2}:\d{2}[,.]\d{3}) --> (\d{2}:\d{2}:\d{2}[,.]\d{3})'
     
     def replace_timestamps(match):
         start_time = match.group(1)
@@ -208,29 +281,32 @@ def adjust_timestamps(content, time_offset):
 
     return re.sub(pattern, replace_timestamps, content)
 
-def convert_to_mp3(input_file):
+def convert_to_mp3(input_file, output_path=None, job=None):
     """
     使用ffmpeg将音频转换为指定码率的MP3格式
     
     Args:
         input_file: 输入音频文件路径
+        output_path: 输出文件路径，默认为 job.output["converted_audio"]
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
     
     Returns:
         str: 转换后的MP3文件路径
     """
+    job = job or default_job()
     print("\n=== 开始音频转换 ===")
-    output_path = OUTPUT_CONFIG["converted_audio"]
+    output_path = output_path or job.output["converted_audio"]
     
     cmd = [
         "ffmpeg",          # 调用ffmpeg命令
         "-i", input_file,  # 输入文件
-        "-b:a", AUDIO_CONFIG["mp3_bitrate"],  # 设置音频比特率
+        "-b:a", job.audio["mp3_bitrate"],  # 设置音频比特率
         "-ac", "1",        # 转换为单声道
         "-y",              # 自动覆盖已存在的文件
         output_path        # 输出文件路径
     ]
     
-    print(f"正在将音频转换为{AUDIO_CONFIG['mp3_bitrate']}比特率的单声道MP3...")
+    print(f"正在将音频转换为{job.audio['mp3_bitrate']}比特率的单声道MP3...")
     result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     
     if result.returncode == 0:
@@ -241,13 +317,19 @@ def convert_to_mp3(input_file):
     print("=== 音频转换完成 ===\n")
     return output_path
 
-def clean_output():
-    """清理所有输出文件和目录"""
+def clean_output(job=None):
+    """
+    清理所有输出文件和目录
+    
+    Args:
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    """
+    job = job or default_job()
     print("\n=== 清理输出文件 ===")
     
     # 清理目录中的文件
-    for dir_path in [OUTPUT_CONFIG["audio_chunks_dir"], 
-                    OUTPUT_CONFIG["trans_chunks_dir"]]:  # 使用新的目录名
+    for dir_path in [job.output["audio_chunks_dir"], 
+                    job.output["trans_chunks_dir"]]:  # 使用新的目录名
         if os.path.exists(dir_path):
             # 删除目录中的文件
             for file in os.listdir(dir_path):
@@ -276,10 +358,10 @@ def clean_output():
                     break  # 目录已经被删除，跳过
     
     # 清理转换后的MP3文件
-    if os.path.exists(OUTPUT_CONFIG["converted_audio"]):
+    if os.path.exists(job.output["converted_audio"]):
         for _ in range(3):  # 最多尝试3次
             try:
-                os.remove(OUTPUT_CONFIG["converted_audio"])
+                os.remove(job.output["converted_audio"])
                 break
             except PermissionError:
                 time.sleep(0.1)  # 等待100毫秒
@@ -314,13 +396,17 @@ def get_supported_audio_files(path):
                 audio_files.append(os.path.join(root, file))
     return sorted(audio_files)  # 排序确保处理顺序一致
 
-def get_output_extension():
+def get_output_extension(job=None):
     """
     根据配置的响应格式返回对应的文件扩展名
     
+    Args:
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
     Returns:
         str: 文件扩展名（包含点号）
     """
+    job = job or default_job()
     format_extensions = {
         "text": ".txt",
         "srt": ".srt",
@@ -328,7 +414,7 @@ def get_output_extension():
         "verbose_json": ".json",
         "vtt": ".vtt"
     }
-    return format_extensions.get(AUDIO_CONFIG["response_format"], ".txt")  # 默认使用 .txt
+    return format_extensions.get(job.audio["response_format"], ".txt")  # 默认使用 .txt
 
 def needs_timestamp_adjustment(response_format):
     """
@@ -342,11 +428,346 @@ def needs_timestamp_adjustment(response_format):
     """
     return response_format in ["srt", "vtt"]
 
-def transcribe_audio(audio_path):
-    """转录音频文件"""
+def get_router(job):
+    """
+    获取任务使用的端点路由
+    
+    任务使用默认端点时返回按 OPENAI_ENDPOINTS 配置的路由，否则为任务的端点单独创建路由
+    
+    Args:
+        job: 任务配置（job_config.JobConfig）
+    
+    Returns:
+        EndpointRouter: 端点路由
+    """
+    key = (job.openai["base_url"], job.openai["api_key"])
+    if key == (OPENAI_CONFIG["base_url"], OPENAI_CONFIG["api_key"]):
+        return router
+    with job_routers_lock:
+        if key not in job_routers:
+            job_routers[key] = EndpointRouter.from_config([dict(job.openai)], ROUTER_CONFIG, ADAPTIVE_CONFIG)
+        return job_routers[key]
+
+def get_transcribe_workers(job=None):
+    """
+    获取流水线中同时上传转录的单元数
+    
+    Args:
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        int: 上传步骤的线程数
+    """
+    job = job or default_job()
+    if ADAPTIVE_CONFIG["enabled"]:
+        # 实际并发由各端点的自适应控制决定，线程数按所有端点的上限之和准备
+        return ADAPTIVE_CONFIG["transcription"]["max"] * len(get_router(job).endpoints)
+    return PIPELINE_CONFIG["transcribe_workers"]
+
+def create_transcription(file_path, job=None):
+    """
+    调用Whisper API转录单个音频文件
+    
+    请求按负载分配到配置的端点，出错时自动切换到其他端点；
+    启用对冲请求时，请求实际发送后的耗时超过近期延迟百分位（按音频大小归一化）会发送重复请求，取先返回的结果并中止另一个请求；
+    启用自适应并发时，每个端点同时进行的请求数按该端点的延迟和限流情况自动调整
+    
+    Args:
+        file_path: 音频文件路径
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: Whisper API返回的转录内容
+    """
+    job = job or default_job()
+    # 延迟按音频大小（MB）归一化，较长的分段不会被误判为拥塞或慢请求
+    size_mb = max(1.0, os.path.getsize(file_path) / 1024 / 1024)
+    
+    def transcribe_with(client):
+        # 每次请求单独打开文件，避免重复请求共用文件指针
+        with open(file_path, "rb") as audio_file_obj:
+            return client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file_obj,
+                response_format=job.audio["response_format"],
+                language=job.audio["language"]
+            )
+    
+    def request(cancel_event):
+        # 出错时自动切换到其他端点
+        def send(client):
+            if cancel_event is None:
+                return transcribe_with(client)
+            # 等待并发名额期间另一个请求已经返回，不再发送
+            if cancel_event.is_set():
+                raise AttemptCancelled("另一个请求已返回")
+            cancel_event.started()
+            # 对冲请求使用单独的客户端，另一个请求先返回时关闭连接以中止上传
+            attempt_client = OpenAI(base_url=client.base_url, api_key=client.api_key, max_retries=client.max_retries)
+            remove_callback = cancel_event.on_cancel(attempt_client.close)
+            try:
+                return transcribe_with(attempt_client)
+            except Exception as e:
+                if cancel_event.is_set():
+                    raise AttemptCancelled("另一个请求已返回，已中止上传") from e
+                raise
+            finally:
+                remove_callback()
+                attempt_client.close()
+        
+        return get_router(job).call(send, size=size_mb)
+    
+    if hedger is None:
+        return request(None)
+    return hedger.call(request, size=size_mb)
+
+def get_preprocessed_path(file_index, job=None):
+    """
+    获取文件预处理后的MP3路径
+    
+    Args:
+        file_index: 文件序号
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: 预处理后的文件路径
+    """
+    job = job or default_job()
+    return os.path.join(job.output["audio_chunks_dir"], f"file{file_index}_preprocessed.mp3")
+
+def preprocess_file(file_index, audio_file, job=None):
+    """
+    去除长静音并按配置加速，生成用于转录的MP3文件
+    
+    Args:
+        file_index: 文件序号
+        audio_file: 原始音频文件路径
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        tuple: (处理后的文件路径, TimeMap)，TimeMap 用于把时间戳映射回原始音频
+    """
+    job = job or default_job()
+    print("\n=== 开始音频预处理 ===")
+    output_path = get_preprocessed_path(file_index, job)
+    print(f"正在去除静音，速度: {PREPROCESS_CONFIG['speed']}倍...")
+    time_map = preprocess_audio(audio_file, output_path, PREPROCESS_CONFIG, job.audio["mp3_bitrate"])
+    saved = 100 - 100 * time_map.output_ms() / max(1, time_map.original_ms)
+    print(f"处理后时长: {time_map.output_ms()/1000:.2f}秒（减少{saved:.0f}%）")
+    print("=== 音频预处理完成 ===\n")
+    return output_path, time_map
+
+def get_output_path(audio_file, job=None):
+    """
+    获取音频文件对应的转录文件路径，使用动态扩展名
+    
+    Args:
+        audio_file: 音频文件路径
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: 转录文件路径
+    """
+    job = job or default_job()
+    output_filename = f"{os.path.splitext(os.path.basename(audio_file))[0]}{get_output_extension(job)}"
+    return os.path.join(job.output["transcripts_dir"], output_filename)
+
+def finish_segment(transcription, prefix, index, offset_ms, job=None):
+    """
+    处理一个分段的转录内容：AI处理、调整时间戳并保存分段文件
+    
+    Args:
+        transcription: Whisper API返回的分段转录内容
+        prefix: 分段文件名前缀
+        index: 分段序号（从0开始）
+        offset_ms: 分段在原音频中的起始时间（毫秒）
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: 处理后的分段内容
+    """
+    job = job or default_job()
+    # 如果是文本格式，使用AI处理
+    if job.audio["response_format"] == "text":
+        transcription = process_text(transcription, job)
+    
+    # 只有在需要时才调整时间戳
+    if needs_timestamp_adjustment(job.audio["response_format"]):
+        transcription = adjust_timestamps(transcription, offset_ms, job)
+    
+    # 保存分段文件
+    segment_output_path = f"{job.output['trans_chunks_dir']}/{prefix}_{index}{get_output_extension(job)}"
+    with open(segment_output_path, "w", encoding="utf-8") as f:
+        f.write(transcription)
+    print(f"{prefix} 第{index+1}段转录完成并保存")
+    return transcription
+
+def merge_transcriptions(parts, job=None):
+    """
+    合并各分段的转录内容
+    
+    Args:
+        parts: 按顺序排列的分段转录内容列表
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: 合并后的内容，非字幕格式会添加分段标记
+    """
+    job = job or default_job()
+    return "".join(format_part(i, transcription, job) for i, transcription in enumerate(parts))
+
+def format_part(index, transcription, job=None):
+    """
+    格式化一个分段在合并文件中的内容
+    
+    Args:
+        index: 分段序号（从0开始）
+        transcription: 分段转录内容
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: 分段内容，非字幕格式会添加分段标记
+    """
+    job = job or default_job()
+    # 对于非字幕格式，添加分段标记
+    if not needs_timestamp_adjustment(job.audio["response_format"]):
+        return f"\n=== 第{index+1}段 ===\n\n{transcription}\n"
+    return transcription + "\n"
+
+def prepare_unit(unit, job=None):
+    """
+    流水线第一步：准备要上传的音频，按需转换或截取
+    
+    Args:
+        unit: scheduler.WorkUnit，整个文件或文件中的一个分段
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        list: (音频文件路径, 在原音频中的起始时间（毫秒）) 列表
+    """
+    job = job or default_job()
+    prefix = f"file{unit.file_index}"
+    name = os.path.basename(unit.file_path)
+    
+    if unit.kind == "direct":
+        # 按预估大小规划的文件（如预处理后的文件）实际超过25MB时分割后依次转录
+        if os.path.getsize(unit.file_path) > job.audio["max_file_size"]:
+            print(f"\n{name} 超过25MB，需要进行分割...")
+            segments = split_audio(unit.file_path, prefix, job)
+            return [(segment_path, i * job.audio["split_interval"]) for i, segment_path in enumerate(segments)]
+        print(f"\n{name} 小于25MB，直接进行转录...")
+        return [(unit.file_path, 0)]
+    
+    if unit.kind == "convert":
+        print(f"\n{name} 超过25MB，需要进行处理...")
+        converted_file = convert_to_mp3(
+            unit.file_path,
+            os.path.join(job.output["audio_chunks_dir"], f"{prefix}_{job.output['converted_audio']}"),
+            job
+        )
+        converted_size = os.path.getsize(converted_file)
+        print(f"转换后文件大小: {converted_size/1024/1024:.2f}MB")
+        
+        # 预估有误差，转换后的文件仍超过25MB时分割后依次转录
+        if converted_size > job.audio["max_file_size"]:
+            print(f"转换后的文件仍超过25MB，需要进行分割...")
+            segments = split_audio(converted_file, prefix, job)
+            return [(segment_path, i * job.audio["split_interval"]) for i, segment_path in enumerate(segments)]
+        return [(converted_file, 0)]
+    
+    # 截取大文件中的一个分段
+    print(f"\n正在截取 {name} 第{unit.index+1}/{unit.count}段...")
+    # 小文件的分段直接复制音频流，保持原格式
+    extension = os.path.splitext(unit.file_path)[1] if unit.stream_copy else ".mp3"
+    segment_path = cut_segment(
+        unit.file_path, unit.start_ms, unit.duration_ms,
+        f"{job.output['audio_chunks_dir']}/{prefix}_segment_{unit.index}{extension}",
+        job, stream_copy=unit.stream_copy
+    )
+    return [(segment_path, unit.start_ms)]
+
+def upload_unit(unit, prepared, job=None):
+    """
+    流水线第二步：调用Whisper API转录准备好的音频
+    
+    Args:
+        unit: scheduler.WorkUnit
+        prepared: prepare_unit 返回的 (音频文件路径, 起始时间) 列表
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        list: (转录内容, 起始时间（毫秒）) 列表
+    """
+    job = job or default_job()
+    if unit.kind == "segment" and prepared:
+        print(f"\n正在转录 {os.path.basename(unit.file_path)} 第{unit.index+1}/{unit.count}段...")
+    return [(create_transcription(path, job), offset_ms) for path, offset_ms in prepared]
+
+def finish_unit(unit, transcribed, job=None):
+    """
+    流水线第三步：AI处理、调整时间戳并合并
+    
+    Args:
+        unit: scheduler.WorkUnit
+        transcribed: upload_unit 返回的 (转录内容, 起始时间) 列表
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: 该单元的转录内容
+    """
+    job = job or default_job()
+    prefix = f"file{unit.file_index}"
+    if not transcribed:
+        # 分段超出了预处理后音频的实际长度
+        return ""
+    if unit.kind == "segment":
+        transcription, offset_ms = transcribed[0]
+        return finish_segment(transcription, prefix, unit.index, offset_ms, job)
+    
+    if len(transcribed) > 1:
+        # 转换后仍需分割的文件
+        return merge_transcriptions([
+            finish_segment(transcription, prefix, i, offset_ms, job)
+            for i, (transcription, offset_ms) in enumerate(transcribed)
+        ], job)
+    
+    transcription = transcribed[0][0]
+    # 如果是文本格式，使用AI处理
+    if job.audio["response_format"] == "text":
+        transcription = process_text(transcription, job)
+    return transcription
+
+def transcribe_unit(unit, job=None):
+    """
+    转录一个调度单元，依次执行流水线的三个步骤
+    
+    Args:
+        unit: scheduler.WorkUnit，整个文件或文件中的一个分段
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    
+    Returns:
+        str: 该单元的转录内容
+    """
+    job = job or default_job()
+    return finish_unit(unit, upload_unit(unit, prepare_unit(unit, job), job), job)
+
+def transcribe_audio(audio_path, on_chunk=None, job=None):
+    """
+    转录音频文件
+    
+    根据音频时长生成调度单元（需要分割的大文件按分段拆成多个单元），
+    按 SCHEDULE_CONFIG 中的策略排序后送入流水线：截取/转换、上传转录、AI处理分别并行，
+    一个分段上传时后面的分段仍在截取。每个分段按顺序完成后立即追加到输出文件
+    
+    Args:
+        audio_path: 音频文件或目录路径
+        on_chunk: 可选回调，每个分段按顺序输出后调用 on_chunk(音频文件路径, 分段序号, 分段总数, 分段内容)
+        job: 任务配置（job_config.JobConfig），默认使用 config.py 中的配置
+    """
+    job = job or default_job()
     try:
         # 开始处理前清理所有临时文件
-        clean_output()
+        clean_output(job)
         
         # 获取要处理的音频文件列表
         audio_files = get_supported_audio_files(audio_path)
@@ -355,121 +776,144 @@ def transcribe_audio(audio_path):
             return
         
         # 确保所有必要的目录都存在
-        for dir_path in [OUTPUT_CONFIG["audio_chunks_dir"], 
-                        OUTPUT_CONFIG["trans_chunks_dir"],
-                        OUTPUT_CONFIG["transcripts_dir"]]:
+        for dir_path in [job.output["audio_chunks_dir"], 
+                        job.output["trans_chunks_dir"],
+                        job.output["transcripts_dir"]]:
             os.makedirs(dir_path, exist_ok=True)
         
-        # 处理每个音频文件
+        # 获取每个文件的时长，生成调度单元
         total_files = len(audio_files)
-        for index, audio_file in enumerate(audio_files, 1):
-            print(f"\n=== 处理文件 {index}/{total_files}: {os.path.basename(audio_file)} ===")
-            
-            # 设置输出文件路径，使用动态扩展名
-            output_filename = f"{os.path.splitext(os.path.basename(audio_file))[0]}{get_output_extension()}"
-            output_path = os.path.join(OUTPUT_CONFIG["transcripts_dir"], output_filename)
+        units = []
+        time_maps = {}  # 文件序号 -> TimeMap，仅在启用预处理时存在
+        preprocess_errors = {}  # 文件序号 -> 预处理时的异常
+        preprocess_locks = {}   # 文件序号 -> 锁，每个文件只预处理一次
+        for file_index, audio_file in enumerate(audio_files):
+            print(f"\n=== 分析文件 {file_index+1}/{total_files}: {os.path.basename(audio_file)} ===")
+            try:
+                duration, _ = get_audio_info(audio_file)
+            except Exception as e:
+                print(f"获取音频信息失败，跳过该文件: {str(e)}")
+                continue
             
-            # 处理单个文件
             file_size = os.path.getsize(audio_file)
             print(f"文件大小: {file_size/1024/1024:.2f}MB")
             
-            try:
-                if file_size > AUDIO_CONFIG["max_file_size"]:
-                    print(f"文件大小超过25MB，需要进行处理...")
-                    converted_file = convert_to_mp3(audio_file)
-                    converted_size = os.path.getsize(converted_file)
-                    print(f"转换后文件大小: {converted_size/1024/1024:.2f}MB")
-                    
-                    # 如果转换后的文件仍然超过25MB，则进行分割
-                    if converted_size > AUDIO_CONFIG["max_file_size"]:
-                        print(f"转换后的文件仍超过25MB，需要进行分割...")
-                        segments = split_audio(converted_file)
-                        all_content = ""
-                        
-                        # 转录每个分段
-                        for i, segment_path in enumerate(segments):
-                            print(f"\n正在转录第{i+1}/{len(segments)}段...")
-                            with open(segment_path, "rb") as audio_file_obj:
-                                transcription = client.audio.transcriptions.create(
-                                    model="whisper-1",
-                                    file=audio_file_obj,
-                                    response_format=AUDIO_CONFIG["response_format"],
-                                    language=AUDIO_CONFIG["language"]
-                                )
-                                
-                                # 如果是文本格式，使用AI处理
-                                if AUDIO_CONFIG["response_format"] == "text":
-                                    transcription = process_text(transcription)
-                                
-                                # 只有在需要时才调整时间戳
-                                if needs_timestamp_adjustment(AUDIO_CONFIG["response_format"]):
-                                    transcription = adjust_timestamps(transcription, i * AUDIO_CONFIG["split_interval"])
-                                
-                                # 保存分段文件
-                                segment_output_path = f"{OUTPUT_CONFIG['trans_chunks_dir']}/segment_{i}{get_output_extension()}"
-                                with open(segment_output_path, "w", encoding="utf-8") as f:
-                                    f.write(transcription)
-                                print(f"第{i+1}段转录完成并保存")
-                                
-                                # 对于非字幕格式，添加分段标记
-                                if not needs_timestamp_adjustment(AUDIO_CONFIG["response_format"]):
-                                    all_content += f"\n=== 第{i+1}段 ===\n\n"
-                                all_content += transcription + "\n"
-                        
-                        # 保存最终合并的文件
-                        with open(output_path, "w", encoding="utf-8") as f:
-                            f.write(all_content)
-                        print(f"\n所有分段已合并到: {output_path}")
-                    else:
-                        # 转换后的文件小于25MB，直接转录
-                        print("转换后的文件小于25MB，直接进行转录...")
-                        with open(converted_file, "rb") as audio_file_obj:
-                            transcription = client.audio.transcriptions.create(
-                                model="whisper-1",
-                                file=audio_file_obj,
-                                response_format=AUDIO_CONFIG["response_format"],
-                                language=AUDIO_CONFIG["language"]
-                            )
-                            
-                            # 如果是文本格式，使用AI处理
-                            if AUDIO_CONFIG["response_format"] == "text":
-                                transcription = process_text(transcription)
-                            
-                            with open(output_path, "w", encoding="utf-8") as f:
-                                f.write(transcription)
-                            print(f"转录完成，已保存到: {output_path}")
-                else:
-                    # 直接转录小文件
-                    print("文件小于25MB，直接进行转录...")
-                    with open(audio_file, "rb") as audio_file_obj:
-                        transcription = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=audio_file_obj,
-                            response_format=AUDIO_CONFIG["response_format"],
-                            language=AUDIO_CONFIG["language"]
-                        )
-                        
-                        # 如果是文本格式，使用AI处理
-                        if AUDIO_CONFIG["response_format"] == "text":
-                            transcription = process_text(transcription)
-                        
-                        with open(output_path, "w", encoding="utf-8") as f:
-                            f.write(transcription)
-                        print(f"转录完成，已保存到: {output_path}")
+            # 可选：去除静音并加速，之后的转录都基于处理后的文件。
+            # 预处理在流水线的截取步骤中进行，这里按加速后的时长上限规划，去除静音只会让文件更短
+            if PREPROCESS_CONFIG["enabled"]:
+                duration = duration / PREPROCESS_CONFIG["speed"]
+                file_size = int(duration * parse_bitrate(job.audio["mp3_bitrate"]) / 8)
+                audio_file = get_preprocessed_path(file_index, job)
+                preprocess_locks[file_index] = threading.Lock()
+            units += plan_file_units(file_index, audio_file, duration, file_size, job.audio, PROGRESSIVE_CONFIG)
+        
+        # 按调度策略排序并预估完成时间
+        policy = SCHEDULE_CONFIG["policy"]
+        workers = get_transcribe_workers(job)
+        finish_workers = PIPELINE_CONFIG["finish_workers"]
+        if ADAPTIVE_CONFIG["enabled"]:
+            finish_workers = max(finish_workers, ADAPTIVE_CONFIG["chat"]["max"])
+        units = order_units(units, policy, SCHEDULE_CONFIG, in_file_order=PROGRESSIVE_CONFIG["enabled"])
+        prediction = simulate(units, workers, SCHEDULE_CONFIG)
+        print(f"\n=== 调度策略: {policy}，并行数: {workers}，共{len(units)}个单元 ===")
+        print(f"预计总耗时: {prediction['makespan']:.0f}秒，文件平均完成时间: {prediction['mean_completion']:.0f}秒")
+        
+        results = {}   # 文件序号 -> {分段序号: 转录内容}
+        emitted = {}   # 文件序号 -> 已按顺序输出的分段内容列表
+        failed = set() # 出错的文件序号，其余单元不再处理
+        
+        def on_done(unit, transcription, error):
+            if unit.file_index in failed:
+                return
+            if error is None:
+                try:
+                    write_unit(unit, transcription)
+                    return
+                except Exception as e:
+                    # 写入、时间戳映射或 on_chunk 回调出错时只影响当前文件
+                    error = e
+            print(f"处理文件时出错 {os.path.basename(audio_files[unit.file_index])}: {str(error)}")
+            failed.add(unit.file_index)
+            # 删除未完成的输出，避免留下看似完整的转录文件
+            partial_path = get_output_path(audio_files[unit.file_index], job) + ".partial"
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        
+        def write_unit(unit, transcription):
+            audio_file = audio_files[unit.file_index]
+            output_path = get_output_path(audio_file, job)
+            partial_path = output_path + ".partial"
+            parts = results.setdefault(unit.file_index, {})
+            parts[unit.index] = transcription
+            pieces = emitted.setdefault(unit.file_index, [])
+            
+            # 按顺序把已完成的分段写入 .partial 文件，第一段覆盖写入，之后追加；全部完成后重命名
+            while len(pieces) in parts:
+                index = len(pieces)
+                part = parts.pop(index)
+                # 超出预处理后音频长度的分段没有内容
+                piece = format_part(index, part, job) if unit.kind == "segment" and part else part
                 
-                print(f"=== 文件 {index}/{total_files} 处理完成 ===")
-            except Exception as e:
-                print(f"处理文件时出错: {str(e)}")
-                continue
+                # 预处理过的文件，把时间戳映射回原始音频
+                if unit.file_index in time_maps and needs_timestamp_adjustment(job.audio["response_format"]):
+                    piece = remap_timestamps(piece, time_maps[unit.file_index])
+                
+                with open(partial_path, "w" if index == 0 else "a", encoding="utf-8") as f:
+                    f.write(piece)
+                pieces.append(piece)
+                if on_chunk is not None and piece:
+                    on_chunk(audio_file, index, unit.count, piece)
+            
+            if len(pieces) < unit.count:
+                return
+            os.replace(partial_path, output_path)
+            print(f"=== 文件 {unit.file_index+1}/{total_files} 处理完成，已保存到: {output_path} ===")
+            
+            # 更新全文检索索引，文件写入后即可检索
+            if INDEX_CONFIG["enabled"]:
+                try:
+                    index_transcript(output_path, "".join(pieces), job.audio["response_format"], audio_file)
+                except Exception as e:
+                    print(f"更新检索索引失败: {str(e)}")
+        
+        def prepare(unit):
+            if unit.file_index in preprocess_locks:
+                # 文件的第一个单元进行预处理，同一文件的其他单元等待其完成
+                with preprocess_locks[unit.file_index]:
+                    if unit.file_index not in time_maps and unit.file_index not in preprocess_errors:
+                        try:
+                            _, time_maps[unit.file_index] = preprocess_file(
+                                unit.file_index, audio_files[unit.file_index], job)
+                        except Exception as e:
+                            preprocess_errors[unit.file_index] = e
+                if unit.file_index in preprocess_errors:
+                    raise RuntimeError(f"音频预处理失败: {preprocess_errors[unit.file_index]}")
+                # 按时长上限规划的分段可能超出处理后音频的实际长度
+                if unit.kind == "segment" and unit.start_ms >= time_maps[unit.file_index].output_ms():
+                    return []
+            return prepare_unit(unit, job)
+        
+        # 预处理/截取/转换、上传、后处理三个步骤通过有界队列组成流水线，各自并行
+        stages = [
+            Stage("prepare", lambda unit, _: prepare(unit), PIPELINE_CONFIG["prepare_workers"]),
+            Stage("transcribe", lambda unit, prepared: upload_unit(unit, prepared, job), workers),
+            Stage("finish", lambda unit, transcribed: finish_unit(unit, transcribed, job), finish_workers),
+        ]
+        run_pipeline(units, stages, on_done, PIPELINE_CONFIG["queue_size"],
+                     skip=lambda unit: unit.file_index in failed)
         
         print("\n=== 所有文件处理完成 ===")
+        limiters = [endpoint.limiter for endpoint in get_router(job).endpoints] + [chat_limiter]
+        for limiter in limiters:
+            if limiter is not None:
+                stats = limiter.stats()
+                print(f"{stats['name']} 并发上限: {stats['limit']}，请求结果: {stats['counts']}")
         
     except Exception as e:
         print(f"处理过程中出错: {str(e)}")
     finally:
         # 确保在任何情况下都清理临时文件
-        clean_output()
-
+        clean_output(job)
 
 if __name__ == "__main__":
 
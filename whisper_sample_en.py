@@ -2,28 +2,52 @@ from openai import OpenAI
 from pydub import AudioSegment
 import os
 import re
-from config import OPENAI_CONFIG, AUDIO_CONFIG, OUTPUT_CONFIG
-from text_processor import process_text
+from config import OPENAI_CONFIG, OPENAI_ENDPOINTS, ROUTER_CONFIG, HEDGE_CONFIG, ADAPTIVE_CONFIG, SCHEDULE_CONFIG, PIPELINE_CONFIG, PREPROCESS_CONFIG, INDEX_CONFIG, PROGRESSIVE_CONFIG
+from text_processor import process_text, chat_limiter
+from hedging import HedgedCaller, AttemptCancelled
+from router import EndpointRouter
+from job_config import default_job
+from scheduler import plan_file_units, order_units, simulate, parse_bitrate
+from pipeline import Stage, run_pipeline
+from preprocess import preprocess_audio, remap_timestamps
+from search_index import index_transcript
 import subprocess
+import threading
 import time
 
-# Initialize OpenAI client
-client = OpenAI(
-    base_url=OPENAI_CONFIG["base_url"],
-    api_key=OPENAI_CONFIG["api_key"]
-)
+# Initialize Whisper API endpoint router
+router = EndpointRouter.from_config(OPENAI_ENDPOINTS, ROUTER_CONFIG, ADAPTIVE_CONFIG)
+
+# Routers for jobs configured with other endpoints, cached by (base_url, api_key)
+job_routers = {}
+job_routers_lock = threading.Lock()
+
+# Initialize hedged requests (optional)
+hedger = None
+if HEDGE_CONFIG["enabled"]:
+    hedger = HedgedCaller(
+        percentile=HEDGE_CONFIG["percentile"],
+        window=HEDGE_CONFIG["window"],
+        min_samples=HEDGE_CONFIG["min_samples"],
+        min_delay=HEDGE_CONFIG["min_delay"],
+        max_extra_ratio=HEDGE_CONFIG["max_extra_ratio"]
+    )
 
 def get_audio_format(file_path):
     """Get the audio format from file extension"""
     return os.path.splitext(file_path)[1][1:].lower()
 
-def get_output_extension():
+def get_output_extension(job=None):
     """
     Get the output file extension based on response format
     
+    Args:
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
     Returns:
         str: File extension (including dot)
     """
+    job = job or default_job()
     format_extensions = {
         "text": ".txt",
         "srt": ".srt",
@@ -31,7 +55,7 @@ def get_output_extension():
         "verbose_json": ".json",
         "vtt": ".vtt"
     }
-    return format_extensions.get(AUDIO_CONFIG["response_format"], ".txt")
+    return format_extensions.get(job.audio["response_format"], ".txt")
 
 def needs_timestamp_adjustment(response_format):
     """
@@ -50,29 +74,31 @@ def add_time(time_str, offset_ms):
     Add time offset to timestamp
     
     Args:
-        time_str: Timestamp string in format "HH:MM:SS,mmm"
+        time_str: Timestamp string in format "HH:MM:SS,mmm" (SRT) or "HH:MM:SS.mmm" (VTT)
         offset_ms: Time offset in milliseconds
     
     Returns:
         str: Adjusted timestamp string
     """
     h, m, s = time_str.split(':')
-    s, ms = s.split(',')
+    separator = ',' if ',' in s else '.'  # SRT uses a comma, VTT a dot
+    s, ms = s.split(separator)
     total_ms = int(h) * 3600000 + int(m) * 60000 + int(s) * 1000 + int(ms)
     total_ms += offset_ms
     h = total_ms // 3600000
     m = (total_ms % 3600000) // 60000
     s = (total_ms % 60000) // 1000
     ms = total_ms % 1000
-    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+    return f"{h:02d}:{m:02d}:{s:02d}{separator}{ms:03d}"
 
-def adjust_timestamps(content, time_offset):
+def adjust_timestamps(content, time_offset, job=None):
     """
     Adjust subtitle timestamps
     
     Args:
         content: Subtitle content
         time_offset: Time offset in milliseconds
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
     
     Returns:
         str: Content with adjusted timestamps
@@ -80,10 +106,11 @@ def adjust_timestamps(content, time_offset):
     Note:
         Currently supports SRT and VTT formats
     """
-    if AUDIO_CONFIG["response_format"] not in ["srt", "vtt"]:
+    job = job or default_job()
+    if job.audio["response_format"] not in ["srt", "vtt"]:
         return content
         
-    pattern = r'(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})'
+    pattern = r'(\d{2}:\d{2}:\d{2}[,.]\d{3}) --> (\d{2}:\d{2}:\d{2}[,.]\d{3})'
     
     def replace_timestamps(match):
         start_time = match.group(1)
@@ -94,9 +121,30 @@ def adjust_timestamps(content, time_offset):
 
     return re.sub(pattern, replace_timestamps, content)
 
-def convert_to_mp3(input_file):
+def get_audio_duration(audio_file_path):
+    """
+    Get audio duration with ffprobe
+    
+    Args:
+        audio_file_path: Audio file path
+    
+    Returns:
+        float: Duration in seconds
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        audio_file_path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return float(result.stdout.decode().strip().split('\n')[0])
+
+def convert_to_mp3(input_file, output_path=None, job=None):
     """Convert audio to MP3 format with specified bitrate"""
-    output_path = OUTPUT_CONFIG["converted_audio"]
+    job = job or default_job()
+    output_path = output_path or job.output["converted_audio"]
     
     cmd = [
         "ffmpeg",
@@ -105,34 +153,27 @@ def convert_to_mp3(input_file):
         output_path
     ]
     
-    print(f"Converting audio to {AUDIO_CONFIG['mp3_bitrate']} bitrate MP3...")
+    print(f"Converting audio to {job.audio['mp3_bitrate']} bitrate MP3...")
     subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     return output_path
 
-def split_audio(audio_file_path):
-    """Split audio file using ffmpeg"""
+def split_audio(audio_file_path, prefix="segment", job=None):
+    """Split audio file using ffmpeg, prefix tells apart files processed at the same time"""
+    job = job or default_job()
     print("\n=== Starting Audio Split ===")
     # Ensure output directories exist
-    os.makedirs(OUTPUT_CONFIG["audio_chunks_dir"], exist_ok=True)
-    os.makedirs(OUTPUT_CONFIG["trans_chunks_dir"], exist_ok=True)
+    os.makedirs(job.output["audio_chunks_dir"], exist_ok=True)
+    os.makedirs(job.output["trans_chunks_dir"], exist_ok=True)
     
     # Get audio duration
-    cmd = [
-        "ffprobe",
-        "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        audio_file_path
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    duration = float(result.stdout)
+    duration = get_audio_duration(audio_file_path)
     
     # Calculate number of segments
-    segment_duration = AUDIO_CONFIG["split_interval"] / 1000  # Convert to seconds
+    segment_duration = job.audio["split_interval"] / 1000  # Convert to seconds
     segments = []
     
-    for i in range(0, int(duration * 1000), int(AUDIO_CONFIG["split_interval"])):
-        segment_path = f"{OUTPUT_CONFIG['audio_chunks_dir']}/segment_{i//int(segment_duration)}.mp3"
+    for i in range(0, int(duration * 1000), int(job.audio["split_interval"])):
+        segment_path = f"{job.output['audio_chunks_dir']}/{prefix}_{i//int(job.audio['split_interval'])}.mp3"
         segments.append(segment_path)
         
         # ffmpeg command for splitting
@@ -146,18 +187,57 @@ def split_audio(audio_file_path):
             segment_path
         ]
         
-        print(f"Splitting segment {i//int(segment_duration)+1}...")
+        print(f"Splitting segment {i//int(job.audio['split_interval'])+1}...")
         subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     
     return segments
 
-def clean_output():
+def cut_segment(audio_file_path, start_ms, duration_ms, segment_path, job=None, stream_copy=False):
+    """
+    Cut a slice of audio and convert it to mono MP3 at the configured bitrate
+    
+    Used to process each segment of a large file as its own schedulable unit
+    
+    Args:
+        audio_file_path: Audio file path
+        start_ms: Start time in milliseconds
+        duration_ms: Duration in milliseconds
+        segment_path: Output file path
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+        stream_copy: Copy the audio stream without re-encoding; the output format must match the input
+    
+    Returns:
+        str: Path of the cut segment
+    
+    Raises:
+        RuntimeError: If ffmpeg fails
+    """
+    job = job or default_job()
+    cmd = [
+        "ffmpeg",
+        "-ss", str(start_ms / 1000),  # Seek before the input for fast positioning
+        "-t", str(duration_ms / 1000),
+        "-i", audio_file_path,
+    ]
+    if stream_copy:
+        cmd += ["-vn", "-c:a", "copy"]
+    else:
+        cmd += ["-b:a", job.audio["mp3_bitrate"], "-ac", "1"]
+    cmd += ["-y", segment_path]
+    
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to cut audio segment: {segment_path}")
+    return segment_path
+
+def clean_output(job=None):
     """Clean all output files and directories"""
+    job = job or default_job()
     print("\n=== Cleaning Output Files ===")
     
     # Clean directories
-    for dir_path in [OUTPUT_CONFIG["audio_chunks_dir"], 
-                    OUTPUT_CONFIG["trans_chunks_dir"]]:
+    for dir_path in [job.output["audio_chunks_dir"], 
+                    job.output["trans_chunks_dir"]]:
         if os.path.exists(dir_path):
             # Delete files in directory
             for file in os.listdir(dir_path):
@@ -186,10 +266,10 @@ def clean_output():
                     break  # Directory already deleted
     
     # Clean converted MP3 file
-    if os.path.exists(OUTPUT_CONFIG["converted_audio"]):
+    if os.path.exists(job.output["converted_audio"]):
         for _ in range(3):  # Try up to 3 times
             try:
-                os.remove(OUTPUT_CONFIG["converted_audio"])
+                os.remove(job.output["converted_audio"])
                 break
             except PermissionError:
                 time.sleep(0.1)  # Wait 100ms
@@ -222,11 +302,351 @@ def get_supported_audio_files(path):
                 audio_files.append(os.path.join(root, file))
     return sorted(audio_files)
 
-def transcribe_audio(audio_path):
-    """Transcribe audio file"""
+def get_router(job):
+    """
+    Get the endpoint router of a job
+    
+    Jobs on the default endpoint share the router built from OPENAI_ENDPOINTS,
+    other endpoints get a router of their own
+    
+    Args:
+        job: Job configuration (job_config.JobConfig)
+    
+    Returns:
+        EndpointRouter: The endpoint router
+    """
+    key = (job.openai["base_url"], job.openai["api_key"])
+    if key == (OPENAI_CONFIG["base_url"], OPENAI_CONFIG["api_key"]):
+        return router
+    with job_routers_lock:
+        if key not in job_routers:
+            job_routers[key] = EndpointRouter.from_config([dict(job.openai)], ROUTER_CONFIG, ADAPTIVE_CONFIG)
+        return job_routers[key]
+
+def get_transcribe_workers(job=None):
+    """
+    Get the number of units uploaded for transcription at the same time
+    
+    Args:
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        int: Thread count of the upload stage
+    """
+    job = job or default_job()
+    if ADAPTIVE_CONFIG["enabled"]:
+        # The per-endpoint adaptive limiters decide the actual concurrency, threads are sized for their combined maximum
+        return ADAPTIVE_CONFIG["transcription"]["max"] * len(get_router(job).endpoints)
+    return PIPELINE_CONFIG["transcribe_workers"]
+
+def create_transcription(file_path, job=None):
+    """
+    Transcribe a single audio file with the Whisper API
+    
+    Requests are routed across the configured endpoints with failover.
+    With hedging enabled, a duplicate request is fired when the call's
+    service time runs past the recent latency percentile, normalised by
+    audio size; the first answer is kept and the other request aborted. With
+    adaptive concurrency enabled, the number of in-flight requests to each
+    endpoint follows that endpoint's latency and throttling
+    
+    Args:
+        file_path: Audio file path
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Transcription returned by the Whisper API
+    """
+    job = job or default_job()
+    # Latency is normalised by audio size (MB) so long segments don't look congested or slow
+    size_mb = max(1.0, os.path.getsize(file_path) / 1024 / 1024)
+    
+    def transcribe_with(client):
+        # Open the file per attempt so duplicates and retries don't share a file position
+        with open(file_path, "rb") as audio_file_obj:
+            return client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file_obj,
+                response_format=job.audio["response_format"],
+                language=job.audio["language"]
+            )
+    
+    def request(cancel_event):
+        # Fail over to another endpoint on endpoint errors
+        def send(client):
+            if cancel_event is None:
+                return transcribe_with(client)
+            # The other attempt answered while this one waited for a slot, don't send
+            if cancel_event.is_set():
+                raise AttemptCancelled("The other attempt has answered")
+            cancel_event.started()
+            # A hedged attempt gets its own client, closed to abort the upload when the other attempt wins
+            attempt_client = OpenAI(base_url=client.base_url, api_key=client.api_key, max_retries=client.max_retries)
+            remove_callback = cancel_event.on_cancel(attempt_client.close)
+            try:
+                return transcribe_with(attempt_client)
+            except Exception as e:
+                if cancel_event.is_set():
+                    raise AttemptCancelled("The other attempt has answered, upload aborted") from e
+                raise
+            finally:
+                remove_callback()
+                attempt_client.close()
+        
+        return get_router(job).call(send, size=size_mb)
+    
+    if hedger is None:
+        return request(None)
+    return hedger.call(request, size=size_mb)
+
+def get_preprocessed_path(file_index, job=None):
+    """
+    Get the path of a file's preprocessed MP3
+    
+    Args:
+        file_index: File index
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Preprocessed file path
+    """
+    job = job or default_job()
+    return os.path.join(job.output["audio_chunks_dir"], f"file{file_index}_preprocessed.mp3")
+
+def preprocess_file(file_index, audio_file, job=None):
+    """
+    Remove long silences and change tempo, producing the MP3 to transcribe
+    
+    Args:
+        file_index: File index
+        audio_file: Original audio file path
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        tuple: (processed file path, TimeMap mapping timestamps back to the original)
+    """
+    job = job or default_job()
+    print("\n=== Starting Audio Preprocessing ===")
+    output_path = get_preprocessed_path(file_index, job)
+    print(f"Removing silences, speed: {PREPROCESS_CONFIG['speed']}x...")
+    time_map = preprocess_audio(audio_file, output_path, PREPROCESS_CONFIG, job.audio["mp3_bitrate"])
+    saved = 100 - 100 * time_map.output_ms() / max(1, time_map.original_ms)
+    print(f"Processed duration: {time_map.output_ms()/1000:.2f}s ({saved:.0f}% shorter)")
+    return output_path, time_map
+
+def get_output_path(audio_file, job=None):
+    """
+    Get the transcript path for an audio file
+    
+    Args:
+        audio_file: Audio file path
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Transcript path with the extension of the response format
+    """
+    job = job or default_job()
+    output_filename = f"{os.path.splitext(os.path.basename(audio_file))[0]}{get_output_extension(job)}"
+    return os.path.join(job.output["transcripts_dir"], output_filename)
+
+def finish_segment(transcription, prefix, index, offset_ms, job=None):
+    """
+    Post-process one segment transcription: process text, adjust timestamps and save it
+    
+    Args:
+        transcription: Segment transcription returned by the Whisper API
+        prefix: Segment file name prefix
+        index: Segment index (from 0)
+        offset_ms: Start of the segment in the original audio in milliseconds
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Processed segment transcription
+    """
+    job = job or default_job()
+    # Process text if needed
+    if job.audio["response_format"] == "text":
+        transcription = process_text(transcription, job)
+    # Adjust timestamps if needed
+    elif needs_timestamp_adjustment(job.audio["response_format"]):
+        transcription = adjust_timestamps(transcription, offset_ms, job)
+    
+    # Save segment
+    segment_output_path = f"{job.output['trans_chunks_dir']}/{prefix}_{index}{get_output_extension(job)}"
+    with open(segment_output_path, "w", encoding="utf-8") as f:
+        f.write(transcription)
+    print(f"{prefix} segment {index+1} transcribed and saved")
+    return transcription
+
+def merge_transcriptions(parts, job=None):
+    """
+    Merge segment transcriptions
+    
+    Args:
+        parts: Segment transcriptions in order
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Merged content, with segment markers for non-subtitle formats
+    """
+    job = job or default_job()
+    return "".join(format_part(i, transcription, job) for i, transcription in enumerate(parts))
+
+def format_part(index, transcription, job=None):
+    """
+    Format one segment for the merged file
+    
+    Args:
+        index: Segment index (from 0)
+        transcription: Segment transcription
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Segment content, with a segment marker for non-subtitle formats
+    """
+    job = job or default_job()
+    # Add segment markers for non-subtitle formats
+    if not needs_timestamp_adjustment(job.audio["response_format"]):
+        return f"\n=== Segment {index+1} ===\n\n{transcription}\n"
+    return transcription + "\n"
+
+def prepare_unit(unit, job=None):
+    """
+    Pipeline step 1: prepare the audio to upload, converting or cutting as needed
+    
+    Args:
+        unit: scheduler.WorkUnit, a whole file or one segment of a file
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        list: (audio file path, start in the original audio in milliseconds) tuples
+    """
+    job = job or default_job()
+    prefix = f"file{unit.file_index}"
+    name = os.path.basename(unit.file_path)
+    
+    if unit.kind == "direct":
+        # A file planned from an estimated size (such as a preprocessed one) that turns out over 25MB is split
+        if os.path.getsize(unit.file_path) > job.audio["max_file_size"]:
+            print(f"\n{name} exceeds 25MB, splitting required...")
+            segments = split_audio(unit.file_path, prefix, job)
+            return [(segment_path, i * job.audio["split_interval"]) for i, segment_path in enumerate(segments)]
+        print(f"\n{name} is under 25MB, transcribing directly...")
+        return [(unit.file_path, 0)]
+    
+    if unit.kind == "convert":
+        print(f"\n{name} exceeds 25MB, processing required...")
+        converted_file = convert_to_mp3(
+            unit.file_path,
+            os.path.join(job.output["audio_chunks_dir"], f"{prefix}_{job.output['converted_audio']}"),
+            job
+        )
+        converted_size = os.path.getsize(converted_file)
+        print(f"Converted file size: {converted_size/1024/1024:.2f}MB")
+        
+        # The size prediction can be off, split the converted file if it is still too large
+        if converted_size > job.audio["max_file_size"]:
+            print(f"Converted file still exceeds 25MB, splitting required...")
+            segments = split_audio(converted_file, prefix, job)
+            return [(segment_path, i * job.audio["split_interval"]) for i, segment_path in enumerate(segments)]
+        return [(converted_file, 0)]
+    
+    # Cut one segment of a large file
+    print(f"\nCutting {name} segment {unit.index+1}/{unit.count}...")
+    # Segments of small files copy the audio stream and keep the original format
+    extension = os.path.splitext(unit.file_path)[1] if unit.stream_copy else ".mp3"
+    segment_path = cut_segment(
+        unit.file_path, unit.start_ms, unit.duration_ms,
+        f"{job.output['audio_chunks_dir']}/{prefix}_segment_{unit.index}{extension}",
+        job, stream_copy=unit.stream_copy
+    )
+    return [(segment_path, unit.start_ms)]
+
+def upload_unit(unit, prepared, job=None):
+    """
+    Pipeline step 2: transcribe the prepared audio with the Whisper API
+    
+    Args:
+        unit: scheduler.WorkUnit
+        prepared: (audio file path, start) tuples returned by prepare_unit
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        list: (transcription, start in milliseconds) tuples
+    """
+    job = job or default_job()
+    if unit.kind == "segment" and prepared:
+        print(f"\nTranscribing {os.path.basename(unit.file_path)} segment {unit.index+1}/{unit.count}...")
+    return [(create_transcription(path, job), offset_ms) for path, offset_ms in prepared]
+
+def finish_unit(unit, transcribed, job=None):
+    """
+    Pipeline step 3: process text, adjust timestamps and merge
+    
+    Args:
+        unit: scheduler.WorkUnit
+        transcribed: (transcription, start) tuples returned by upload_unit
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Transcription of the unit
+    """
+    job = job or default_job()
+    prefix = f"file{unit.file_index}"
+    if not transcribed:
+        # Segment past the end of the preprocessed audio
+        return ""
+    if unit.kind == "segment":
+        transcription, offset_ms = transcribed[0]
+        return finish_segment(transcription, prefix, unit.index, offset_ms, job)
+    
+    if len(transcribed) > 1:
+        # Converted file that still had to be split
+        return merge_transcriptions([
+            finish_segment(transcription, prefix, i, offset_ms, job)
+            for i, (transcription, offset_ms) in enumerate(transcribed)
+        ], job)
+    
+    transcription = transcribed[0][0]
+    # Process text if needed
+    if job.audio["response_format"] == "text":
+        transcription = process_text(transcription, job)
+    return transcription
+
+def transcribe_unit(unit, job=None):
+    """
+    Transcribe one scheduled unit, running the three pipeline steps in sequence
+    
+    Args:
+        unit: scheduler.WorkUnit, a whole file or one segment of a file
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    
+    Returns:
+        str: Transcription of the unit
+    """
+    job = job or default_job()
+    return finish_unit(unit, upload_unit(unit, prepare_unit(unit, job), job), job)
+
+def transcribe_audio(audio_path, on_chunk=None, job=None):
+    """
+    Transcribe audio file
+    
+    Files are planned into units by duration (large files become one unit
+    per segment), ordered by the SCHEDULE_CONFIG policy and fed through a
+    pipeline where converting/cutting, uploading and text processing each run
+    in parallel, so one segment uploads while the next ones are still being
+    cut. Each segment is appended to the output as soon as it is in order.
+    
+    Args:
+        audio_path: Audio file or directory path
+        on_chunk: Optional callback called as on_chunk(audio file, segment index,
+            segment count, content) whenever a segment is written in order
+        job: Job configuration (job_config.JobConfig), defaults to the config.py settings
+    """
+    job = job or default_job()
     try:
         # Clean temporary files before starting
-        clean_output()
+        clean_output(job)
         
         # Get list of audio files to process
         audio_files = get_supported_audio_files(audio_path)
@@ -235,119 +655,145 @@ def transcribe_audio(audio_path):
             return
         
         # Ensure all necessary directories exist
-        for dir_path in [OUTPUT_CONFIG["audio_chunks_dir"], 
-                        OUTPUT_CONFIG["trans_chunks_dir"],
-                        OUTPUT_CONFIG["transcripts_dir"]]:
+        for dir_path in [job.output["audio_chunks_dir"], 
+                        job.output["trans_chunks_dir"],
+                        job.output["transcripts_dir"]]:
             os.makedirs(dir_path, exist_ok=True)
         
-        # Process each audio file
+        # Probe durations and plan units
         total_files = len(audio_files)
-        for index, audio_file in enumerate(audio_files, 1):
-            print(f"\n=== Processing File {index}/{total_files}: {os.path.basename(audio_file)} ===")
-            
-            # Set output file path
-            output_filename = f"{os.path.splitext(os.path.basename(audio_file))[0]}{get_output_extension()}"
-            output_path = os.path.join(OUTPUT_CONFIG["transcripts_dir"], output_filename)
+        units = []
+        time_maps = {}  # file index -> TimeMap, only when preprocessing is enabled
+        preprocess_errors = {}  # file index -> preprocessing exception
+        preprocess_locks = {}   # file index -> lock, each file is preprocessed once
+        for file_index, audio_file in enumerate(audio_files):
+            print(f"\n=== Analyzing File {file_index+1}/{total_files}: {os.path.basename(audio_file)} ===")
+            try:
+                duration = get_audio_duration(audio_file)
+            except Exception as e:
+                print(f"Failed to get audio info, skipping file: {str(e)}")
+                continue
             
-            # Process single file
             file_size = os.path.getsize(audio_file)
-            print(f"File size: {file_size/1024/1024:.2f}MB")
+            print(f"Duration: {duration:.2f}s, file size: {file_size/1024/1024:.2f}MB")
             
-            try:
-                if file_size > AUDIO_CONFIG["max_file_size"]:
-                    print(f"File size exceeds 25MB, processing required...")
-                    converted_file = convert_to_mp3(audio_file)
-                    converted_size = os.path.getsize(converted_file)
-                    print(f"Converted file size: {converted_size/1024/1024:.2f}MB")
-                    
-                    # If converted file still exceeds limit, split it
-                    if converted_size > AUDIO_CONFIG["max_file_size"]:
-                        print(f"Converted file still exceeds 25MB, splitting required...")
-                        segments = split_audio(converted_file)
-                        all_content = ""
-                        
-                        # Transcribe each segment
-                        for i, segment_path in enumerate(segments):
-                            print(f"\nTranscribing segment {i+1}/{len(segments)}...")
-                            with open(segment_path, "rb") as audio_file_obj:
-                                transcription = client.audio.transcriptions.create(
-                                    model="whisper-1",
-                                    file=audio_file_obj,
-                                    response_format=AUDIO_CONFIG["response_format"],
-                                    language=AUDIO_CONFIG["language"]
-                                )
-                                
-                                # Process text if needed
-                                if AUDIO_CONFIG["response_format"] == "text":
-                                    transcription = process_text(transcription)
-                                # Adjust timestamps if needed
-                                elif needs_timestamp_adjustment(AUDIO_CONFIG["response_format"]):
-                                    transcription = adjust_timestamps(transcription, i * AUDIO_CONFIG["split_interval"])
-                                
-                                # Save segment
-                                segment_output_path = f"{OUTPUT_CONFIG['trans_chunks_dir']}/segment_{i}{get_output_extension()}"
-                                with open(segment_output_path, "w", encoding="utf-8") as f:
-                                    f.write(transcription)
-                                print(f"Segment {i+1} transcribed and saved")
-                                
-                                # Add segment markers for non-subtitle formats
-                                if not needs_timestamp_adjustment(AUDIO_CONFIG["response_format"]):
-                                    all_content += f"\n=== Segment {i+1} ===\n\n"
-                                all_content += transcription + "\n"
-                        
-                        # Save merged file
-                        with open(output_path, "w", encoding="utf-8") as f:
-                            f.write(all_content)
-                        print(f"\nAll segments merged to: {output_path}")
-                    else:
-                        # Transcribe converted file directly
-                        print("Converted file is under 25MB, transcribing directly...")
-                        with open(converted_file, "rb") as audio_file_obj:
-                            transcription = client.audio.transcriptions.create(
-                                model="whisper-1",
-                                file=audio_file_obj,
-                                response_format=AUDIO_CONFIG["response_format"],
-                                language=AUDIO_CONFIG["language"]
-                            )
-                            
-                            # Process text if needed
-                            if AUDIO_CONFIG["response_format"] == "text":
-                                transcription = process_text(transcription)
-                                
-                            with open(output_path, "w", encoding="utf-8") as f:
-                                f.write(transcription)
-                            print(f"Transcription complete, saved to: {output_path}")
-                else:
-                    # Transcribe small file directly
-                    print("File is under 25MB, transcribing directly...")
-                    with open(audio_file, "rb") as audio_file_obj:
-                        transcription = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=audio_file_obj,
-                            response_format=AUDIO_CONFIG["response_format"],
-                            language=AUDIO_CONFIG["language"]
-                        )
-                        
-                        # Process text if needed
-                        if AUDIO_CONFIG["response_format"] == "text":
-                            transcription = process_text(transcription)
-                            
-                        with open(output_path, "w", encoding="utf-8") as f:
-                            f.write(transcription)
-                        print(f"Transcription complete, saved to: {output_path}")
+            # Optionally remove silences and speed up, later steps use the processed file.
+            # Preprocessing runs in the pipeline's prepare stage, so plan from the sped-up
+            # duration as an upper bound; removing silences only makes the file shorter
+            if PREPROCESS_CONFIG["enabled"]:
+                duration = duration / PREPROCESS_CONFIG["speed"]
+                file_size = int(duration * parse_bitrate(job.audio["mp3_bitrate"]) / 8)
+                audio_file = get_preprocessed_path(file_index, job)
+                preprocess_locks[file_index] = threading.Lock()
+            units += plan_file_units(file_index, audio_file, duration, file_size, job.audio, PROGRESSIVE_CONFIG)
+        
+        # Order units by policy and predict completion times
+        policy = SCHEDULE_CONFIG["policy"]
+        workers = get_transcribe_workers(job)
+        finish_workers = PIPELINE_CONFIG["finish_workers"]
+        if ADAPTIVE_CONFIG["enabled"]:
+            finish_workers = max(finish_workers, ADAPTIVE_CONFIG["chat"]["max"])
+        units = order_units(units, policy, SCHEDULE_CONFIG, in_file_order=PROGRESSIVE_CONFIG["enabled"])
+        prediction = simulate(units, workers, SCHEDULE_CONFIG)
+        print(f"\n=== Scheduling policy: {policy}, workers: {workers}, {len(units)} units ===")
+        print(f"Predicted makespan: {prediction['makespan']:.0f}s, mean file completion: {prediction['mean_completion']:.0f}s")
+        
+        results = {}    # file index -> {segment index: transcription}
+        emitted = {}    # file index -> contents written so far, in order
+        failed = set()  # Files with an error, their remaining units are skipped
+        
+        def on_done(unit, transcription, error):
+            if unit.file_index in failed:
+                return
+            if error is None:
+                try:
+                    write_unit(unit, transcription)
+                    return
+                except Exception as e:
+                    # A write, timestamp mapping or on_chunk error only fails this file
+                    error = e
+            print(f"Error processing file {os.path.basename(audio_files[unit.file_index])}: {str(error)}")
+            failed.add(unit.file_index)
+            # Remove the unfinished output so no truncated transcript looks complete
+            partial_path = get_output_path(audio_files[unit.file_index], job) + ".partial"
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        
+        def write_unit(unit, transcription):
+            audio_file = audio_files[unit.file_index]
+            output_path = get_output_path(audio_file, job)
+            partial_path = output_path + ".partial"
+            parts = results.setdefault(unit.file_index, {})
+            parts[unit.index] = transcription
+            pieces = emitted.setdefault(unit.file_index, [])
+            
+            # Write finished segments in order to a .partial file, the first one overwrites it; renamed once complete
+            while len(pieces) in parts:
+                index = len(pieces)
+                part = parts.pop(index)
+                # Segments past the end of the preprocessed audio have no content
+                piece = format_part(index, part, job) if unit.kind == "segment" and part else part
                 
-                print(f"=== File {index}/{total_files} Processing Complete ===")
-            except Exception as e:
-                print(f"Error processing file: {str(e)}")
-                continue
+                # Map timestamps of preprocessed files back to the original audio
+                if unit.file_index in time_maps and needs_timestamp_adjustment(job.audio["response_format"]):
+                    piece = remap_timestamps(piece, time_maps[unit.file_index])
+                
+                with open(partial_path, "w" if index == 0 else "a", encoding="utf-8") as f:
+                    f.write(piece)
+                pieces.append(piece)
+                if on_chunk is not None and piece:
+                    on_chunk(audio_file, index, unit.count, piece)
+            
+            if len(pieces) < unit.count:
+                return
+            os.replace(partial_path, output_path)
+            print(f"=== File {unit.file_index+1}/{total_files} Processing Complete, saved to: {output_path} ===")
+            
+            # Update the search index so the file is searchable right away
+            if INDEX_CONFIG["enabled"]:
+                try:
+                    index_transcript(output_path, "".join(pieces), job.audio["response_format"], audio_file)
+                except Exception as e:
+                    print(f"Failed to update search index: {str(e)}")
+        
+        def prepare(unit):
+            if unit.file_index in preprocess_locks:
+                # The file's first unit preprocesses it, its other units wait for that
+                with preprocess_locks[unit.file_index]:
+                    if unit.file_index not in time_maps and unit.file_index not in preprocess_errors:
+                        try:
+                            _, time_maps[unit.file_index] = preprocess_file(
+                                unit.file_index, audio_files[unit.file_index], job)
+                        except Exception as e:
+                            preprocess_errors[unit.file_index] = e
+                if unit.file_index in preprocess_errors:
+                    raise RuntimeError(f"Audio preprocessing failed: {preprocess_errors[unit.file_index]}")
+                # Segments planned from the upper bound may start past the end of the processed audio
+                if unit.kind == "segment" and unit.start_ms >= time_maps[unit.file_index].output_ms():
+                    return []
+            return prepare_unit(unit, job)
+        
+        # Preprocess/convert/cut, upload and post-processing run as a pipeline of bounded queues, each stage in parallel
+        stages = [
+            Stage("prepare", lambda unit, _: prepare(unit), PIPELINE_CONFIG["prepare_workers"]),
+            Stage("transcribe", lambda unit, prepared: upload_unit(unit, prepared, job), workers),
+            Stage("finish", lambda unit, transcribed: finish_unit(unit, transcribed, job), finish_workers),
+        ]
+        run_pipeline(units, stages, on_done, PIPELINE_CONFIG["queue_size"],
+                     skip=lambda unit: unit.file_index in failed)
         
         print("\n=== All Files Processing Complete ===")
+        limiters = [endpoint.limiter for endpoint in get_router(job).endpoints] + [chat_limiter]
+        for limiter in limiters:
+            if limiter is not None:
+                stats = limiter.stats()
+                print(f"{stats['name']} concurrency limit: {stats['limit']}, outcomes: {stats['counts']}")
         
     except Exception as e:
         print(f"Error during processing: {str(e)}")
     finally:
         # Clean temporary files in any case
-        clean_output()
+        clean_output(job)
 
 if __name__ == "__main__":
     input_path = r"path/to/your/audio"  # Can be a single file or directory
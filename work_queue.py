@@ -0,0 +1,513 @@
+"""
+Distributed segment work queue
+
+A coordinator plans audio files into segment tasks and puts them in a shared
+durable queue. Any number of worker processes, on this or other hosts, claim
+tasks with a lease, transcribe them and report the results. The coordinator
+then merges each file's results in order. Segment results already carry
+their offsets, so merging is a concatenation.
+
+The default backend is a SQLite database in a directory on shared storage,
+using SQLite's file locking for atomic claims. Other stores can be plugged in
+by implementing QueueBackend. Audio paths are stored as absolute paths, so
+shared storage must be mounted at the same path on every host, and hosts'
+clocks must roughly agree because leases are wall-clock times.
+
+Usage:
+    python work_queue.py --queue /mnt/shared/queue submit path/to/audio --job JOB
+    python work_queue.py --queue /mnt/shared/queue worker          # on each host, any number of times
+    python work_queue.py --queue /mnt/shared/queue status
+    python work_queue.py --queue /mnt/shared/queue merge JOB --wait
+"""
+
+import argparse
+import json
+from abc import ABC, abstractmethod
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from config import DISTRIBUTED_CONFIG, SCHEDULE_CONFIG, INDEX_CONFIG
+from job_config import JobConfig
+from scheduler import WorkUnit, plan_file_units, order_units
+from search_index import index_transcript
+from whisper_sample import (get_supported_audio_files, get_audio_info, transcribe_unit,
+                            format_part, get_output_path, clean_output)
+
+
+class QueueBackend(ABC):
+    """
+    Interface of a durable task store
+
+    Tasks are dicts with the WorkUnit fields (file_index, file_path, kind,
+    index, count, start_ms, duration_ms) plus id, job, status (pending,
+    leased, done or failed), worker, attempts, result and error.
+    """
+
+    @abstractmethod
+    def add_job(self, job_id, audio_path, audio_config, files, units):
+        """
+        Store a job and its units as pending tasks
+
+        Raises:
+            ValueError: If a job with this id already exists
+        """
+
+    @abstractmethod
+    def get_job(self, job_id):
+        """Get a job as a dict with job, audio_path, audio_config and files, or None"""
+
+    @abstractmethod
+    def claim(self, worker, lease):
+        """Lease the next runnable task for lease seconds, or return None"""
+
+    @abstractmethod
+    def renew(self, task_id, worker, lease):
+        """Extend a lease; returns False if the worker no longer holds it"""
+
+    @abstractmethod
+    def complete(self, task_id, worker, result):
+        """Record a task's result"""
+
+    @abstractmethod
+    def fail(self, task_id, worker, error):
+        """Record a failed attempt; the task is retried until max_attempts"""
+
+    @abstractmethod
+    def tasks(self, job_id):
+        """Get all tasks of a job ordered by file and segment"""
+
+    @abstractmethod
+    def status(self, job_id=None):
+        """Get task counts by status, per job"""
+
+
+class SQLiteBackend(QueueBackend):
+    """Task store in a SQLite database, usable from several processes and hosts"""
+
+    def __init__(self, queue_dir, max_attempts=3):
+        """
+        Args:
+            queue_dir: Directory holding the queue database, on shared storage for several hosts
+            max_attempts: Attempts before a task is marked failed
+        """
+        os.makedirs(queue_dir, exist_ok=True)
+        self.db_path = os.path.join(queue_dir, "queue.db")
+        self.max_attempts = max_attempts
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job TEXT PRIMARY KEY,
+                    audio_path TEXT,
+                    audio_config TEXT,
+                    files TEXT,
+                    created REAL
+                );
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT,
+                    file_index INTEGER,
+                    file_path TEXT,
+                    kind TEXT,
+                    unit_index INTEGER,
+                    unit_count INTEGER,
+                    start_ms INTEGER,
+                    duration_ms INTEGER,
+                    status TEXT DEFAULT 'pending',
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    updated REAL
+                );
+                CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id);
+            """)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def _write(self, fn):
+        """Run fn(conn) in a write transaction"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()
+
+    def _read(self, sql, params=()):
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def add_job(self, job_id, audio_path, audio_config, files, units):
+        def insert(conn):
+            if conn.execute("SELECT 1 FROM jobs WHERE job = ?", (job_id,)).fetchone():
+                raise ValueError(f"Job already exists: {job_id}")
+            conn.execute(
+                "INSERT INTO jobs (job, audio_path, audio_config, files, created) VALUES (?, ?, ?, ?, ?)",
+                (job_id, audio_path, json.dumps(audio_config), json.dumps(files), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO tasks (job, file_index, file_path, kind, unit_index, unit_count, "
+                "start_ms, duration_ms, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job_id, unit.file_index, unit.file_path, unit.kind, unit.index, unit.count,
+                  unit.start_ms, unit.duration_ms, time.time()) for unit in units]
+            )
+        self._write(insert)
+
+    def get_job(self, job_id):
+        rows = self._read("SELECT * FROM jobs WHERE job = ?", (job_id,))
+        if not rows:
+            return None
+        job = rows[0]
+        job["audio_config"] = json.loads(job["audio_config"])
+        job["files"] = json.loads(job["files"])
+        return job
+
+    def claim(self, worker, lease):
+        def take(conn):
+            while True:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT id, status, attempts FROM tasks "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                task_id, status, attempts = row
+                if status == "leased" and attempts >= self.max_attempts:
+                    # The last holder stopped renewing on its final attempt
+                    conn.execute(
+                        "UPDATE tasks SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                        ("lease expired", now, task_id)
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (worker, now + lease, now, task_id)
+                )
+                return task_id
+
+        task_id = self._write(take)
+        if task_id is None:
+            return None
+        return self._task(task_id)
+
+    def _task(self, task_id):
+        row = self._read("SELECT * FROM tasks WHERE id = ?", (task_id,))[0]
+        row["index"] = row.pop("unit_index")
+        row["count"] = row.pop("unit_count")
+        return row
+
+    def renew(self, task_id, worker, lease):
+        def extend(conn):
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_until = ?, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + lease, time.time(), task_id, worker)
+            )
+            return cursor.rowcount == 1
+        return self._write(extend)
+
+    def complete(self, task_id, worker, result):
+        # The first result wins, including one from a worker whose lease ran out
+        self._write(lambda conn: conn.execute(
+            "UPDATE tasks SET status = 'done', worker = ?, result = ?, error = NULL, updated = ? "
+            "WHERE id = ? AND status != 'done'",
+            (worker, result, time.time(), task_id)
+        ))
+
+    def fail(self, task_id, worker, error):
+        self._write(lambda conn: conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_until = NULL, updated = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, error, time.time(), task_id, worker)
+        ))
+
+    def tasks(self, job_id):
+        rows = self._read(
+            "SELECT * FROM tasks WHERE job = ? ORDER BY file_index, unit_index", (job_id,)
+        )
+        for row in rows:
+            row["index"] = row.pop("unit_index")
+            row["count"] = row.pop("unit_count")
+        return rows
+
+    def status(self, job_id=None):
+        rows = self._read(
+            "SELECT job, status, COUNT(*) AS n FROM tasks "
+            + ("WHERE job = ? " if job_id else "")
+            + "GROUP BY job, status",
+            (job_id,) if job_id else ()
+        )
+        counts = {}
+        for row in rows:
+            counts.setdefault(row["job"], {"pending": 0, "leased": 0, "done": 0, "failed": 0})[row["status"]] = row["n"]
+        return counts
+
+
+def task_unit(task):
+    """Rebuild the WorkUnit of a task"""
+    return WorkUnit(task["file_index"], task["file_path"], task["kind"], index=task["index"],
+                    count=task["count"], start_ms=task["start_ms"], duration_ms=task["duration_ms"])
+
+
+class Coordinator:
+    """Plan jobs into tasks and merge their results"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def submit(self, audio_path, job_id=None, audio=None):
+        """
+        Plan a file or directory and queue its tasks
+
+        Args:
+            audio_path: Audio file or directory on shared storage
+            job_id: Job name, generated when omitted
+            audio: Overrides for AUDIO_CONFIG, e.g. {"language": "zh"}
+
+        Returns:
+            tuple: (job id, number of tasks)
+
+        Raises:
+            ValueError: If a job with this id already exists
+        """
+        job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        # Checked again when the job is stored, this only saves probing the files
+        if self.backend.get_job(job_id) is not None:
+            raise ValueError(f"Job already exists: {job_id}")
+        job = JobConfig.create(audio=audio)
+        files = [os.path.abspath(path) for path in get_supported_audio_files(audio_path)]
+
+        units = []
+        for file_index, audio_file in enumerate(files):
+            try:
+                duration, _ = get_audio_info(audio_file)
+            except Exception as e:
+                print(f"Failed to probe {audio_file}, skipping: {str(e)}")
+                continue
+            units += plan_file_units(file_index, audio_file, duration, os.path.getsize(audio_file), job.audio)
+
+        # Workers claim in insertion order, so queue the longest units first
+        units = order_units(units, "lpt", SCHEDULE_CONFIG)
+        self.backend.add_job(job_id, os.path.abspath(audio_path), dict(job.audio), files, units)
+        return job_id, len(units)
+
+    def wait(self, job_id, poll_interval=5.0):
+        """
+        Wait until no task of a job is pending or leased
+
+        Returns:
+            dict: Final task counts by status
+        """
+        while True:
+            counts = self.backend.status(job_id).get(job_id, {})
+            print(f"Job {job_id}: {counts}")
+            if not counts.get("pending") and not counts.get("leased"):
+                return counts
+            time.sleep(poll_interval)
+
+    def merge(self, job_id, output=None):
+        """
+        Write the transcript of every finished file of a job
+
+        Args:
+            job_id: Job to merge
+            output: Overrides for OUTPUT_CONFIG, e.g. {"transcripts_dir": "out"}
+
+        Returns:
+            dict: Audio file path -> transcript path, or None if the file is incomplete
+        """
+        stored = self.backend.get_job(job_id)
+        if stored is None:
+            raise ValueError(f"Unknown job: {job_id}")
+        job = JobConfig.create(audio=stored["audio_config"], output=output)
+        os.makedirs(job.output["transcripts_dir"], exist_ok=True)
+
+        by_file = {}
+        for task in self.backend.tasks(job_id):
+            by_file.setdefault(task["file_index"], []).append(task)
+
+        merged = {}
+        for file_index, tasks in sorted(by_file.items()):
+            audio_file = stored["files"][file_index]
+            unfinished = [task for task in tasks if task["status"] != "done"]
+            if unfinished:
+                errors = "; ".join(f"segment {task['index'] + 1}: {task['error'] or task['status']}" for task in unfinished)
+                print(f"Incomplete, not merged: {audio_file} ({errors})")
+                merged[audio_file] = None
+                continue
+
+            if tasks[0]["kind"] == "segment":
+                content = "".join(format_part(task["index"], task["result"], job) for task in tasks)
+            else:
+                content = tasks[0]["result"]
+            output_path = get_output_path(audio_file, job)
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            merged[audio_file] = output_path
+            print(f"Merged {len(tasks)} tasks into {output_path}")
+
+            if INDEX_CONFIG["enabled"]:
+                try:
+                    index_transcript(output_path, content, job.audio["response_format"], audio_file)
+                except Exception as e:
+                    print(f"Failed to update the search index: {str(e)}")
+        return merged
+
+
+class Worker:
+    """Claim tasks, transcribe them and report the results"""
+
+    def __init__(self, backend, worker_id=None, lease=300, poll_interval=2.0):
+        """
+        Args:
+            backend: QueueBackend
+            worker_id: Name of this worker, defaults to host-pid
+            lease: Lease length in seconds, renewed while a task runs
+            poll_interval: Seconds to wait when no task is available
+        """
+        self.backend = backend
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.jobs = {}  # Job id -> JobConfig
+
+    def job_config(self, job_id):
+        if job_id not in self.jobs:
+            stored = self.backend.get_job(job_id)
+            # Temporary directories named after the worker and unique to the job, so workers on one host don't collide
+            self.jobs[job_id] = JobConfig.create(job_id=self.worker_id, audio=stored["audio_config"])
+        return self.jobs[job_id]
+
+    def run_task(self, task):
+        """Transcribe one claimed task, renewing its lease until done"""
+        job = self.job_config(task["job"])
+        for dir_path in [job.output["audio_chunks_dir"], job.output["trans_chunks_dir"]]:
+            os.makedirs(dir_path, exist_ok=True)
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.lease / 3):
+                if not self.backend.renew(task["id"], self.worker_id, self.lease):
+                    print(f"Lost the lease on task {task['id']}")
+                    return
+
+        renewer = threading.Thread(target=heartbeat, daemon=True)
+        renewer.start()
+        try:
+            result = transcribe_unit(task_unit(task), job)
+        except Exception as e:
+            print(f"Task {task['id']} failed: {str(e)}")
+            self.backend.fail(task["id"], self.worker_id, str(e))
+            return False
+        finally:
+            stop.set()
+            renewer.join()
+            clean_output(job)
+        self.backend.complete(task["id"], self.worker_id, result)
+        return True
+
+    def run(self, exit_when_idle=False, max_tasks=None):
+        """
+        Process tasks until stopped
+
+        Args:
+            exit_when_idle: Return once no task is pending or leased
+            max_tasks: Return after this many tasks
+
+        Returns:
+            int: Number of tasks processed
+        """
+        processed = 0
+        while max_tasks is None or processed < max_tasks:
+            task = self.backend.claim(self.worker_id, self.lease)
+            if task is None:
+                if exit_when_idle and not any(
+                    counts["pending"] or counts["leased"] for counts in self.backend.status().values()
+                ):
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            print(f"[{self.worker_id}] task {task['id']}: {os.path.basename(task['file_path'])} "
+                  f"{task['index'] + 1}/{task['count']} (attempt {task['attempts']})")
+            self.run_task(task)
+            processed += 1
+        return processed
+
+
+def open_backend(queue_dir=None):
+    """Open the SQLite backend in queue_dir, defaulting to DISTRIBUTED_CONFIG["queue_dir"]"""
+    return SQLiteBackend(queue_dir or DISTRIBUTED_CONFIG["queue_dir"], DISTRIBUTED_CONFIG["max_attempts"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed transcription work queue")
+    parser.add_argument("--queue", help="Queue directory, defaults to DISTRIBUTED_CONFIG['queue_dir']")
+    commands = parser.add_subparsers(dest="command")
+
+    submit_parser = commands.add_parser("submit", help="Plan files into tasks and queue them")
+    submit_parser.add_argument("path", help="Audio file or directory on shared storage")
+    submit_parser.add_argument("--job", help="Job name")
+    submit_parser.add_argument("--language", help="Audio language, overrides AUDIO_CONFIG")
+    submit_parser.add_argument("--format", help="Response format, overrides AUDIO_CONFIG")
+
+    worker_parser = commands.add_parser("worker", help="Process tasks")
+    worker_parser.add_argument("--id", help="Worker name, defaults to host-pid")
+    worker_parser.add_argument("--exit-when-idle", action="store_true", help="Exit once no task is pending or leased")
+
+    commands.add_parser("status", help="Show task counts per job")
+
+    merge_parser = commands.add_parser("merge", help="Write the transcripts of a job")
+    merge_parser.add_argument("job", help="Job name")
+    merge_parser.add_argument("--wait", action="store_true", help="Wait for the job to finish first")
+    merge_parser.add_argument("--output", help="Transcripts directory, overrides OUTPUT_CONFIG")
+    args = parser.parse_args()
+
+    backend = open_backend(args.queue)
+    if args.command == "submit":
+        audio = {}
+        if args.language:
+            audio["language"] = args.language
+        if args.format:
+            audio["response_format"] = args.format
+        try:
+            job_id, count = Coordinator(backend).submit(args.path, job_id=args.job, audio=audio)
+        except ValueError as e:
+            raise SystemExit(f"{e}, choose another --job name")
+        print(f"Queued job {job_id} with {count} tasks")
+    elif args.command == "worker":
+        worker = Worker(backend, args.id, DISTRIBUTED_CONFIG["lease"], DISTRIBUTED_CONFIG["poll_interval"])
+        print(f"Worker {worker.worker_id} processed {worker.run(exit_when_idle=args.exit_when_idle)} tasks")
+    elif args.command == "status":
+        for job_id, counts in backend.status().items():
+            print(f"{job_id}: {counts}")
+    elif args.command == "merge":
+        coordinator = Coordinator(backend)
+        if args.wait:
+            coordinator.wait(args.job, DISTRIBUTED_CONFIG["poll_interval"])
+        coordinator.merge(args.job, {"transcripts_dir": args.output} if args.output else None)
+    else:
+        parser.print_help()